@@ -0,0 +1,4 @@
+from .market_state import MarketState, BboWindow
+from .api_server import ApiServer, start_api_server
+
+__all__ = ["MarketState", "BboWindow", "ApiServer", "start_api_server"]
@@ -0,0 +1,165 @@
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+import asyncio
+import json
+import threading
+import websockets
+from logger import get_logger
+from api.market_state import BookKey, MarketState
+from market import OrderBook
+
+logger = get_logger(__name__)
+
+# HTTP (polling):
+#   GET /books                                   books currently running
+#   GET /book/<exchange>/<ccy_1>/<ccy_2>         full depth of one book
+#   GET /bbo/<ccy_1>/<ccy_2>                     cross-exchange best bid/offer
+#   GET /history/<ccy_1>/<ccy_2>?minutes=N       BBO changes of the last N minutes, per exchange
+# WebSocket (push), send {"action": "subscribe" | "unsubscribe", "channel": "book" | "bbo", "instrument": "BTC/USD",
+# "exchange": "Kraken" (book channel only)}: the payload (same as HTTP) is pushed every time it changes.
+
+STATUS_LINES = {200: b"HTTP/1.1 200 OK", 400: b"HTTP/1.1 400 Bad Request", 404: b"HTTP/1.1 404 Not Found",
+                405: b"HTTP/1.1 405 Method Not Allowed"}
+
+
+class ApiServer:
+
+    def __init__(self, books_provider: Callable[[], Dict[BookKey, OrderBook]], host: str = "127.0.0.1", port: int = 9110,
+                 ws_port: int = 9111, history_minutes: float = 15, history_max_rows: int = 100_000,
+                 push_interval_ms: float = 250, sync_interval_s: float = 1):
+        self.books_provider = books_provider
+        self.state = MarketState(history_minutes, history_max_rows)
+        self.host = host
+        self.port = port
+        self.ws_port = ws_port
+        self.push_interval = push_interval_ms / 1000
+        self.sync_interval = sync_interval_s
+
+    def route(self, target: str) -> Tuple[int, Optional[bytes]]:
+        url = urlsplit(target)
+        parts = [part for part in url.path.split("/") if part]
+        try:
+            if parts == ["books"]:
+                payload = self.state.books()
+            elif len(parts) == 4 and parts[0] == "book":
+                payload = self.state.book(parts[1], parts[2], parts[3])
+            elif len(parts) == 3 and parts[0] == "bbo":
+                payload = self.state.bbo(parts[1], parts[2])
+            elif len(parts) == 3 and parts[0] == "history":
+                minutes = float(parse_qs(url.query).get("minutes", [self.state.history_minutes])[0])
+                payload = self.state.history(parts[1], parts[2], minutes)
+            else:
+                return 404, None
+        except ValueError:
+            return 400, None
+        return (200, payload[0]) if payload is not None else (404, None)
+
+    async def handle_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # Minimal HTTP/1.1 server (GET only, keep-alive)
+        try:
+            while True:
+                try:
+                    request_line = await reader.readline()
+                    if not request_line:
+                        break
+                    keep_alive = not request_line.rstrip().endswith(b"HTTP/1.0")
+                    while True:
+                        header = await reader.readline()
+                        if header in (b"\r\n", b"\n", b""):
+                            break
+                        if header.lower().startswith(b"connection:"):
+                            keep_alive = b"close" not in header.lower()
+                except ValueError:
+                    # Request line or header longer than the stream's limit: the rest of the request can't be read
+                    await self.write_response(writer, 400, None, keep_alive=False)
+                    break
+                try:
+                    method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                except ValueError:
+                    status, body = 400, None
+                    keep_alive = False
+                else:
+                    status, body = self.route(target) if method == "GET" else (405, None)
+                await self.write_response(writer, status, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def write_response(writer: asyncio.StreamWriter, status: int, body: Optional[bytes], keep_alive: bool) -> None:
+        body = body if body is not None else json.dumps({"error": status}).encode("utf-8")
+        writer.write(b"%s\r\nContent-Type: application/json\r\nContent-Length: %d\r\nConnection: %s\r\n\r\n" % (
+            STATUS_LINES[status], len(body), b"keep-alive" if keep_alive else b"close"))
+        writer.write(body)
+        await writer.drain()
+
+    def channel_payload(self, subscription: tuple) -> Optional[str]:
+        channel, instrument, exchange = subscription
+        ccy_1, _, ccy_2 = instrument.partition("/")
+        payload = self.state.book(exchange, ccy_1, ccy_2) if channel == "book" else self.state.bbo(ccy_1, ccy_2)
+        return payload[1] if payload is not None else None
+
+    async def handle_ws(self, websocket, path=None) -> None:
+        subscriptions: Dict[tuple, Optional[str]] = {}
+
+        async def receive():
+            async for message in websocket:
+                try:
+                    request = json.loads(message)
+                    subscription = (request["channel"], request["instrument"], request.get("exchange"))
+                    if subscription[0] not in ("book", "bbo") or (subscription[0] == "book" and not subscription[2]):
+                        raise ValueError(f"Invalid subscription {subscription}")
+                except (ValueError, KeyError, TypeError) as e:
+                    await websocket.send(json.dumps({"error": str(e)}))
+                    continue
+                if request.get("action", "subscribe") == "unsubscribe":
+                    subscriptions.pop(subscription, None)
+                else:
+                    subscriptions[subscription] = None
+
+        receiver = asyncio.ensure_future(receive())
+        try:
+            while not receiver.done():
+                for subscription, last_sent in list(subscriptions.items()):
+                    payload = self.channel_payload(subscription)
+                    # Cached payloads are the same object until the data changes
+                    if payload is not None and payload is not last_sent:
+                        await websocket.send(payload)
+                        subscriptions[subscription] = payload
+                await asyncio.sleep(self.push_interval)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            receiver.cancel()
+            # Retrieves how the receiver ended, so that its exception isn't reported as never retrieved
+            result = (await asyncio.gather(receiver, return_exceptions=True))[0]
+            if isinstance(result, Exception) and not isinstance(result, websockets.ConnectionClosed):
+                logger.error(f"Error while receiving websocket subscriptions: {result!r}")
+
+    async def sync_books(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                # The universe lock may be held while books are being stopped: off the event loop
+                self.state.sync_books(await loop.run_in_executor(None, self.books_provider))
+            except Exception as e:
+                logger.exception(f"Error while syncing the API's books: {e}")
+            await asyncio.sleep(self.sync_interval)
+
+    async def serve(self) -> None:
+        http_server = await asyncio.start_server(self.handle_http, self.host, self.port)
+        async with http_server, websockets.serve(self.handle_ws, self.host, self.ws_port):
+            logger.info(f"API listening on http://{self.host}:{self.port} and ws://{self.host}:{self.ws_port}")
+            await self.sync_books()
+
+
+def start_api_server(books_provider: Callable[[], Dict[BookKey, OrderBook]], **kwargs) -> ApiServer:
+    """Runs an ApiServer on its own event loop, in a daemon thread."""
+    server = ApiServer(books_provider, **kwargs)
+    api_thread = threading.Thread(target=asyncio.run, args=(server.serve(),), name="api_server")
+    api_thread.daemon = True
+    api_thread.start()
+    return server
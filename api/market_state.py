@@ -0,0 +1,157 @@
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+import json
+import time
+import pytz
+from logger import get_logger
+from market import OrderBook
+
+logger = get_logger(__name__)
+
+BookKey = Tuple[str, str, str]
+
+
+def _copy(rows: deque) -> list:
+    # The deque is appended to (and trimmed) on the feed handler thread
+    while True:
+        try:
+            return list(rows)
+        except RuntimeError:
+            continue
+
+
+class BboWindow:
+    """
+    The last `minutes` of BBO changes of one order book, registered as one of its bbo_listeners: it is filled on the
+    feed handler thread and read on the API thread.
+    """
+
+    def __init__(self, order_book: OrderBook, minutes: float, max_rows: int):
+        self.order_book = order_book
+        self.window = timedelta(minutes=minutes)
+        # (event_time, bid_q, bid, ask, ask_q)
+        self.rows = deque(maxlen=max_rows)
+        self.last: Optional[tuple] = None
+        self.version = 0
+
+    def __call__(self, order_book: OrderBook, event_time: datetime, bid_q: float, bid: float, ask: float, ask_q: float) -> None:
+        rows = self.rows
+        self.last = (event_time, bid_q, bid, ask, ask_q)
+        rows.append(self.last)
+        cutoff = event_time - self.window
+        while rows[0][0] < cutoff:
+            rows.popleft()
+        self.version += 1
+
+
+class MarketState:
+    """
+    What the API serves, straight from the in-memory order books. Every payload is serialized once and cached along
+    with the version of the data it was built from (order book version, BBO window versions), and only rebuilt once
+    that version changed: any number of clients polling an unchanged book share the same bytes.
+    Not thread safe: meant to be used from the API's event loop only.
+    """
+
+    def __init__(self, history_minutes: float = 15, history_max_rows: int = 100_000):
+        self.history_minutes = history_minutes
+        self.history_max_rows = history_max_rows
+        self.order_books: Dict[BookKey, OrderBook] = {}
+        self.windows: Dict[BookKey, BboWindow] = {}
+        # key -> (version, bytes, str)
+        self._cache: Dict[tuple, Tuple[object, bytes, str]] = {}
+
+    def sync_books(self, order_books: Dict[BookKey, OrderBook]) -> None:
+        """Follows the books added to/removed from the universe."""
+        for key, order_book in order_books.items():
+            window = self.windows.get(key)
+            if window is None or window.order_book is not order_book:
+                window = BboWindow(order_book, self.history_minutes, self.history_max_rows)
+                order_book.add_bbo_listener(window)
+                self.windows[key] = window
+        for key in self.windows.keys() - order_books.keys():
+            window = self.windows.pop(key)
+            window.order_book.remove_bbo_listener(window)
+        if order_books.keys() != self.order_books.keys():
+            # Payloads of removed books can go, others are invalidated by their versions
+            self._cache.clear()
+        self.order_books = order_books
+
+    def _cached(self, key: tuple, version, build: Callable[[], object]) -> Tuple[bytes, str]:
+        cached = self._cache.get(key)
+        if cached is None or cached[0] != version:
+            text = json.dumps(build(), separators=(",", ":"))
+            cached = (version, text.encode("utf-8"), text)
+            self._cache[key] = cached
+        return cached[1], cached[2]
+
+    def _instrument_windows(self, ccy_1: str, ccy_2: str) -> List[Tuple[str, BboWindow]]:
+        return sorted((key[0], window) for key, window in self.windows.items() if key[1] == ccy_1 and key[2] == ccy_2)
+
+    # Payloads, None for unknown books/instruments
+    def books(self) -> Tuple[bytes, str]:
+        keys = tuple(sorted(self.order_books))
+        return self._cached(("books",), keys, lambda: [
+            {"exchange": exchange, "instrument": f"{ccy_1}/{ccy_2}"} for exchange, ccy_1, ccy_2 in keys
+        ])
+
+    def book(self, exchange: str, ccy_1: str, ccy_2: str) -> Optional[Tuple[bytes, str]]:
+        order_book = self.order_books.get((exchange, ccy_1, ccy_2))
+        if order_book is None:
+            return None
+
+        def build():
+            last_update, bids, asks = order_book.depth_snapshot()
+            return {"exchange": exchange, "instrument": f"{ccy_1}/{ccy_2}", "time": last_update.isoformat(),
+                    "bids": bids, "asks": asks}
+
+        return self._cached(("book", exchange, ccy_1, ccy_2), (id(order_book), order_book.version), build)
+
+    def bbo(self, ccy_1: str, ccy_2: str) -> Optional[Tuple[bytes, str]]:
+        windows = self._instrument_windows(ccy_1, ccy_2)
+        if not windows:
+            return None
+
+        def build():
+            quotes = {}
+            for exchange, window in windows:
+                if window.last is not None:
+                    event_time, bid_q, bid, ask, ask_q = window.last
+                    quotes[exchange] = {"time": event_time.isoformat(), "bid_q": bid_q, "bid": bid, "ask": ask, "ask_q": ask_q}
+            bids = [(quote["bid"], exchange) for exchange, quote in quotes.items() if quote["bid"] is not None]
+            asks = [(quote["ask"], exchange) for exchange, quote in quotes.items() if quote["ask"] is not None]
+            best_bid, best_bid_exchange = max(bids) if bids else (None, None)
+            best_ask, best_ask_exchange = min(asks) if asks else (None, None)
+            return {"instrument": f"{ccy_1}/{ccy_2}", "exchanges": quotes,
+                    "best_bid": best_bid, "best_bid_exchange": best_bid_exchange,
+                    "best_ask": best_ask, "best_ask_exchange": best_ask_exchange,
+                    # Negative when buying on one exchange and selling on another is profitable (before fees)
+                    "spread": best_ask - best_bid if bids and asks else None}
+
+        return self._cached(("bbo", ccy_1, ccy_2), tuple((id(window), window.version) for _, window in windows), build)
+
+    def history(self, ccy_1: str, ccy_2: str, minutes: float) -> Optional[Tuple[bytes, str]]:
+        windows = self._instrument_windows(ccy_1, ccy_2)
+        if not windows:
+            return None
+        # Rounded, as it's part of the cache key
+        minutes = min(round(minutes, 1), self.history_minutes)
+
+        def build():
+            cutoff = datetime.now(pytz.UTC) - timedelta(minutes=minutes)
+            exchanges = {}
+            for exchange, window in windows:
+                rows = [row for row in _copy(window.rows) if row[0] >= cutoff]
+                # Columnar, about half the size of a list of objects
+                exchanges[exchange] = {
+                    "time": [row[0].isoformat() for row in rows],
+                    "bid_q": [row[1] for row in rows],
+                    "bid": [row[2] for row in rows],
+                    "ask": [row[3] for row in rows],
+                    "ask_q": [row[4] for row in rows],
+                }
+            return {"instrument": f"{ccy_1}/{ccy_2}", "minutes": minutes, "exchanges": exchanges}
+
+        # The window also slides with time: payloads are rebuilt at most once a second
+        version = (int(time.time()), tuple((id(window), window.version) for _, window in windows))
+        return self._cached(("history", ccy_1, ccy_2, minutes), version, build)
@@ -0,0 +1,6 @@
+from .data_source import QuoteEvent, stream_order_book, merged_events
+from .engine import BacktestEngine, BacktestResult, Strategy, Order, Fill, BUY, SELL
+from .strategies import CrossExchangeArbitrage
+
+__all__ = ["QuoteEvent", "stream_order_book", "merged_events", "BacktestEngine", "BacktestResult", "Strategy", "Order",
+           "Fill", "BUY", "SELL", "CrossExchangeArbitrage"]
@@ -0,0 +1,42 @@
+from datetime import datetime
+from heapq import merge
+from typing import Iterator, List, NamedTuple, Tuple
+from database import db_helper
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class QuoteEvent(NamedTuple):
+    timestamp: datetime
+    exchange: str
+    currency_1: str
+    currency_2: str
+    bid_q: float
+    bid: float
+    ask: float
+    ask_q: float
+
+
+def stream_order_book(exchange: str, currency_1: str, currency_2: str, start: datetime, end: datetime, chunk_size: int = 50_000) -> Iterator[QuoteEvent]:
+    """
+    Yields the order_book rows of one book between start (included) and end (excluded), in timestamp order.
+    Rows are read through a server-side cursor, chunk_size at a time, so memory use doesn't depend on the horizon.
+    """
+    query = """
+        SELECT timestamp, bid_q, bid, ask, ask_q FROM order_book
+        WHERE exchange = %s AND currency_1 = %s AND currency_2 = %s AND timestamp >= %s AND timestamp < %s
+        ORDER BY timestamp, id
+    """
+    rows_read = 0
+    for _, rows in db_helper.stream_rows(query, (exchange, currency_1, currency_2, start, end), chunk_size):
+        for timestamp, bid_q, bid, ask, ask_q in rows:
+            yield QuoteEvent(timestamp, exchange, currency_1, currency_2, bid_q, bid, ask, ask_q)
+        rows_read += len(rows)
+    logger.debug(f"stream_order_book: {rows_read} rows read for {exchange}:{currency_1}/{currency_2}")
+
+
+def merged_events(books: List[Tuple[str, str, str]], start: datetime, end: datetime, chunk_size: int = 50_000) -> Iterator[QuoteEvent]:
+    """Time ordered stream of the quote events of several (exchange, currency_1, currency_2) books."""
+    streams = [stream_order_book(exchange, currency_1, currency_2, start, end, chunk_size) for exchange, currency_1, currency_2 in books]
+    return merge(*streams, key=lambda event: event.timestamp)
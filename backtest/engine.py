@@ -0,0 +1,205 @@
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from heapq import heappush, heappop
+from itertools import count
+from typing import Dict, Iterable, List, Optional, Tuple
+import time
+from backtest.data_source import QuoteEvent
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+BUY, SELL = 1, -1
+
+
+@dataclass
+class Order:
+    exchange: str
+    currency_1: str
+    side: int
+    quantity: float
+    limit_price: float
+    submit_time: datetime
+    execute_time: datetime
+    trade_id: int
+
+
+@dataclass
+class Fill:
+    order: Order
+    quantity: float
+    price: float
+    fee: float
+    time: datetime
+
+
+@dataclass
+class BacktestResult:
+    events: int = 0
+    signals: int = 0
+    orders: int = 0
+    filled_orders: int = 0
+    partially_filled_orders: int = 0
+    missed_orders: int = 0
+    traded_notional: float = 0.0
+    fees: float = 0.0
+    cash: float = 0.0
+    # (exchange, currency_1) -> quantity
+    positions: Dict[Tuple[str, str], float] = field(default_factory=dict)
+    inventory_value: float = 0.0
+    trades: List[dict] = field(default_factory=list)
+    elapsed_seconds: float = 0.0
+
+    @property
+    def net_pnl(self) -> float:
+        # Fees are already taken out of cash, open positions are marked to the last mid
+        return self.cash + self.inventory_value
+
+    @property
+    def fill_ratio(self) -> float:
+        return self.filled_orders / self.orders if self.orders else 0.0
+
+    def summary(self) -> dict:
+        return {
+            "events": self.events,
+            "events_per_second": self.events / self.elapsed_seconds if self.elapsed_seconds else 0.0,
+            "signals": self.signals,
+            "orders": self.orders,
+            "filled_orders": self.filled_orders,
+            "partially_filled_orders": self.partially_filled_orders,
+            "missed_orders": self.missed_orders,
+            "fill_ratio": self.fill_ratio,
+            "traded_notional": self.traded_notional,
+            "fees": self.fees,
+            "realised_cash": self.cash,
+            "inventory_value": self.inventory_value,
+            "net_pnl": self.net_pnl,
+            "open_positions": {f"{exchange}:{ccy}": qty for (exchange, ccy), qty in self.positions.items() if abs(qty) > 1e-12},
+        }
+
+
+class Strategy(ABC):
+
+    @abstractmethod
+    def on_quote(self, engine: "BacktestEngine", event: QuoteEvent) -> None:
+        """Called after every quote update, may submit orders through engine.submit_order"""
+        pass
+
+    def on_fill(self, engine: "BacktestEngine", fill: Fill) -> None:
+        pass
+
+
+class BacktestEngine:
+    """
+    Replays a time ordered stream of top of book quotes and simulates the execution of the orders submitted by a strategy:
+     - each order reaches its exchange after that exchange's latency, and executes against the quote prevailing then
+     - orders are immediate-or-cancel limit orders: they fill up to the top of book size (and max_order_size) if the
+       price is at least as good as their limit, and are missed otherwise
+     - taking fees (in %, same convention as the web GUI) are charged on the filled notional
+    """
+
+    def __init__(self, strategy: Strategy, taking_fees: Dict[str, float], latency_ms: Dict[str, float] = None,
+                 max_order_size: Dict[str, float] = None, max_quote_age_s: float = 5.0):
+        self.strategy = strategy
+        self.taking_fees = {exchange: fee / 100 for exchange, fee in taking_fees.items()}
+        self.latency = {exchange: timedelta(milliseconds=ms) for exchange, ms in (latency_ms or {}).items()}
+        self.max_order_size = max_order_size or {}
+        self.max_quote_age = timedelta(seconds=max_quote_age_s)
+        # (exchange, currency_1) -> last QuoteEvent
+        self.quotes: Dict[Tuple[str, str], QuoteEvent] = {}
+        # currency_1 -> exchanges quoting it
+        self.exchanges_per_currency: Dict[str, List[str]] = defaultdict(list)
+        self.now: Optional[datetime] = None
+        self.result = BacktestResult()
+        self._pending: List[tuple] = []
+        self._sequence = count()
+        self._trade_ids = count()
+        self._positions: Dict[Tuple[str, str], float] = defaultdict(float)
+        self._pending_per_currency: Dict[str, int] = defaultdict(int)
+
+    def new_trade_id(self) -> int:
+        return next(self._trade_ids)
+
+    def fresh_quote(self, exchange: str, currency_1: str) -> Optional[QuoteEvent]:
+        quote = self.quotes.get((exchange, currency_1))
+        if quote is None or self.now - quote.timestamp > self.max_quote_age:
+            return None
+        return quote
+
+    def has_pending_orders(self, currency_1: str) -> bool:
+        return self._pending_per_currency[currency_1] > 0
+
+    def submit_order(self, exchange: str, currency_1: str, side: int, quantity: float, limit_price: float, trade_id: int) -> Order:
+        max_size = self.max_order_size.get(currency_1, self.max_order_size.get("default"))
+        if max_size is not None:
+            quantity = min(quantity, max_size)
+        order = Order(exchange, currency_1, side, quantity, limit_price, self.now,
+                      self.now + self.latency.get(exchange, timedelta(0)), trade_id)
+        heappush(self._pending, (order.execute_time, next(self._sequence), order))
+        self._pending_per_currency[currency_1] += 1
+        self.result.orders += 1
+        return order
+
+    def run(self, events: Iterable[QuoteEvent]) -> BacktestResult:
+        t0 = time.perf_counter()
+        quotes, pending, on_quote = self.quotes, self._pending, self.strategy.on_quote
+        for event in events:
+            # Orders reaching their exchange before this event execute against the quotes prevailing until now
+            while pending and pending[0][0] <= event.timestamp:
+                self.now = pending[0][0]
+                self._execute(heappop(pending)[2])
+            self.now = event.timestamp
+            key = (event.exchange, event.currency_1)
+            if key not in quotes:
+                self.exchanges_per_currency[event.currency_1].append(event.exchange)
+            quotes[key] = event
+            self.result.events += 1
+            on_quote(self, event)
+        while pending:
+            self.now = pending[0][0]
+            self._execute(heappop(pending)[2])
+
+        self.result.positions = dict(self._positions)
+        self.result.inventory_value = sum(
+            quantity * (quotes[key].bid + quotes[key].ask) / 2 for key, quantity in self._positions.items() if key in quotes
+        )
+        self.result.elapsed_seconds = time.perf_counter() - t0
+        logger.info(f"Backtest complete: {self.result.summary()}")
+        return self.result
+
+    def _execute(self, order: Order) -> None:
+        self._pending_per_currency[order.currency_1] -= 1
+        quote = self.quotes.get((order.exchange, order.currency_1))
+        if quote is None:
+            self.result.missed_orders += 1
+            return
+        if order.side == BUY:
+            price, available = quote.ask, quote.ask_q
+            marketable = price <= order.limit_price
+        else:
+            price, available = quote.bid, quote.bid_q
+            marketable = price >= order.limit_price
+        quantity = min(order.quantity, available) if marketable else 0.0
+        if quantity <= 0:
+            self.result.missed_orders += 1
+            return
+        if quantity < order.quantity:
+            self.result.partially_filled_orders += 1
+        else:
+            self.result.filled_orders += 1
+
+        notional = quantity * price
+        fee = notional * self.taking_fees.get(order.exchange, 0.0)
+        self.result.cash -= order.side * notional + fee
+        self.result.fees += fee
+        self.result.traded_notional += notional
+        self._positions[(order.exchange, order.currency_1)] += order.side * quantity
+        fill = Fill(order, quantity, price, fee, self.now)
+        self.result.trades.append({
+            "trade_id": order.trade_id, "time": self.now, "exchange": order.exchange, "currency_1": order.currency_1,
+            "side": "buy" if order.side == BUY else "sell", "quantity": quantity, "price": price, "fee": fee,
+            "latency_ms": (self.now - order.submit_time).total_seconds() * 1000,
+        })
+        self.strategy.on_fill(self, fill)
@@ -0,0 +1,50 @@
+import argparse
+from datetime import datetime
+from backtest import merged_events
+from database import db_helper
+from database.arb_episodes import BATCH, delete_episodes, store_episodes
+from logger import get_logger
+from market import detect_episodes
+
+logger = get_logger(__name__)
+
+# Finds the arbitrage episodes of the order_book history and stores them in arb_episodes (source 'batch'), e.g.:
+#   python backtest/find_arb_episodes.py --start 2024-08-01 --end 2024-08-08 --fees Coinbase=0.6 Kraken=0.4 --replace
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arbitrage episodes over the order_book history")
+    parser.add_argument("--start", required=True, type=datetime.fromisoformat)
+    parser.add_argument("--end", required=True, type=datetime.fromisoformat)
+    parser.add_argument("--coins", nargs="+", help="Default: every coin in the currencies table")
+    parser.add_argument("--exchanges", nargs="+", help="Default: every exchange in the exchanges table")
+    parser.add_argument("--currency-2", default="USD")
+    parser.add_argument("--fees", nargs="+", metavar="EXCHANGE=PCT", help="Taking fees in %% per exchange")
+    parser.add_argument("--min-edge-bps", type=float, default=0.0)
+    parser.add_argument("--max-quote-age-s", type=float, default=5.0)
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    parser.add_argument("--batch-size", type=int, default=1_000, help="Episodes per insert")
+    parser.add_argument("--replace", action="store_true", help="Delete the batch episodes of the period first")
+    args = parser.parse_args()
+
+    coins = args.coins or [row[0] for row in db_helper.fetch_all("SELECT currency FROM currencies")]
+    exchanges = args.exchanges or [row[0] for row in db_helper.fetch_all("SELECT exchange FROM exchanges")]
+    books = [(exchange, coin, args.currency_2) for coin in coins for exchange in exchanges]
+    taking_fees = {exchange: float(fee) for exchange, fee in (pair.split("=", 1) for pair in args.fees or [])}
+
+    if args.replace:
+        delete_episodes(BATCH, args.start, args.end, coins)
+    stored, episodes = 0, []
+    for episode in detect_episodes(merged_events(books, args.start, args.end, args.chunk_size), taking_fees,
+                                   args.min_edge_bps, args.max_quote_age_s):
+        episodes.append(episode)
+        if len(episodes) >= args.batch_size:
+            stored += store_episodes(episodes, BATCH)
+            episodes.clear()
+    stored += store_episodes(episodes, BATCH)
+    logger.info(f"{stored} arb episodes stored for {args.start} - {args.end}")
+    print(f"{stored} arb episodes stored")
+
+
+if __name__ == "__main__":
+    main()
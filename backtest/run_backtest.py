@@ -0,0 +1,53 @@
+import argparse
+import json
+from datetime import datetime
+from backtest import BacktestEngine, CrossExchangeArbitrage, merged_events
+from database import db_helper
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Usage (same PYTHONPATH as main.py), e.g. a week of all coins with the GUI's default fees:
+#   python backtest/run_backtest.py --start 2024-08-01 --end 2024-08-08 --fees Coinbase=0.6 Kraken=0.4 \
+#       --latency-ms Coinbase=80 Kraken=120 --max-size BTC=0.5 ETH=5 default=1000 --min-edge-bps 2
+
+
+def key_values(pairs, cast=float) -> dict:
+    return {key: cast(value) for key, value in (pair.split("=", 1) for pair in pairs or [])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross exchange arbitrage backtest over the order_book history")
+    parser.add_argument("--start", required=True, type=datetime.fromisoformat)
+    parser.add_argument("--end", required=True, type=datetime.fromisoformat)
+    parser.add_argument("--coins", nargs="+", help="Default: every coin in the currencies table")
+    parser.add_argument("--exchanges", nargs="+", help="Default: every exchange in the exchanges table")
+    parser.add_argument("--currency-2", default="USD")
+    parser.add_argument("--fees", nargs="+", metavar="EXCHANGE=PCT", help="Taking fees in %% per exchange")
+    parser.add_argument("--latency-ms", nargs="+", metavar="EXCHANGE=MS", help="Order latency per exchange")
+    parser.add_argument("--max-size", nargs="+", metavar="COIN=QTY", help="Max order size per coin ('default' for the others)")
+    parser.add_argument("--min-edge-bps", type=float, default=0.0)
+    parser.add_argument("--slippage-bps", type=float, default=0.0)
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    parser.add_argument("--trades-output", help="Optional JSON file to write every fill to")
+    args = parser.parse_args()
+
+    coins = args.coins or [row[0] for row in db_helper.fetch_all("SELECT currency FROM currencies")]
+    exchanges = args.exchanges or [row[0] for row in db_helper.fetch_all("SELECT exchange FROM exchanges")]
+    books = [(exchange, coin, args.currency_2) for coin in coins for exchange in exchanges]
+
+    engine = BacktestEngine(
+        strategy=CrossExchangeArbitrage(min_edge_bps=args.min_edge_bps, slippage_bps=args.slippage_bps),
+        taking_fees=key_values(args.fees),
+        latency_ms=key_values(args.latency_ms),
+        max_order_size=key_values(args.max_size),
+    )
+    result = engine.run(merged_events(books, args.start, args.end, args.chunk_size))
+    print(json.dumps(result.summary(), indent=2))
+    if args.trades_output:
+        with open(args.trades_output, "w") as file:
+            json.dump(result.trades, file, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+from backtest.data_source import QuoteEvent
+from backtest.engine import BacktestEngine, Strategy, BUY, SELL
+
+
+class CrossExchangeArbitrage(Strategy):
+    """
+    Buys on the exchange with the lowest ask and sells on the one with the highest bid whenever the spread between the
+    two, net of both taking fees, is at least min_edge_bps (of the mid). Both legs are sent at once, as IOC orders
+    limited to the observed prices (plus slippage_bps), for the size available on both tops of book.
+    Only one trade per coin is in flight at a time.
+    """
+
+    def __init__(self, min_edge_bps: float = 0.0, slippage_bps: float = 0.0):
+        self.min_edge = min_edge_bps / 10_000
+        self.slippage = slippage_bps / 10_000
+
+    def on_quote(self, engine: BacktestEngine, event: QuoteEvent) -> None:
+        currency_1 = event.currency_1
+        if engine.has_pending_orders(currency_1):
+            return
+        for other_exchange in engine.exchanges_per_currency[currency_1]:
+            if other_exchange == event.exchange:
+                continue
+            other = engine.fresh_quote(other_exchange, currency_1)
+            if other is None:
+                continue
+            # The updated book can be either the selling or the buying leg
+            for sell, buy in ((event, other), (other, event)):
+                fees = sell.bid * engine.taking_fees.get(sell.exchange, 0.0) + buy.ask * engine.taking_fees.get(buy.exchange, 0.0)
+                edge = sell.bid - buy.ask - fees
+                if edge <= 0 or edge / ((sell.bid + buy.ask) / 2) < self.min_edge:
+                    continue
+                quantity = min(sell.bid_q, buy.ask_q)
+                engine.result.signals += 1
+                trade_id = engine.new_trade_id()
+                engine.submit_order(sell.exchange, currency_1, SELL, quantity, sell.bid * (1 - self.slippage), trade_id)
+                engine.submit_order(buy.exchange, currency_1, BUY, quantity, buy.ask * (1 + self.slippage), trade_id)
+                return
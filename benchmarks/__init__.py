@@ -0,0 +1,3 @@
+from .harness import BenchmarkResult, run_benchmark
+
+__all__ = ["BenchmarkResult", "run_benchmark"]
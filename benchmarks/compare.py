@@ -0,0 +1,47 @@
+import argparse
+import json
+import sys
+
+# Usage:
+#   python benchmarks/compare.py baseline.json candidate.json --threshold 10
+# Exits with status 1 if any benchmark's throughput dropped (or p99 grew) by more than the threshold (in %).
+
+
+def load_results(path: str) -> dict:
+    with open(path, "r") as file:
+        report = json.load(file)
+    return {result["name"]: result for result in report["results"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports and flag regressions")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent")
+    args = parser.parse_args()
+
+    baseline = load_results(args.baseline)
+    candidate = load_results(args.candidate)
+
+    regressions = []
+    print(f"{'benchmark':<55} {'ops/s (base)':>14} {'ops/s (new)':>14} {'change':>8} {'p99 change':>11}")
+    for name in sorted(baseline.keys() & candidate.keys()):
+        base, new = baseline[name], candidate[name]
+        throughput_change = (new["ops_per_sec"] / base["ops_per_sec"] - 1) * 100
+        p99_change = (new["p99_us"] / base["p99_us"] - 1) * 100 if base["p99_us"] else 0.0
+        flag = ""
+        if throughput_change < -args.threshold or p99_change > args.threshold:
+            regressions.append(name)
+            flag = "  <-- REGRESSION"
+        print(f"{name:<55} {base['ops_per_sec']:>14,.0f} {new['ops_per_sec']:>14,.0f} {throughput_change:>+7.1f}% {p99_change:>+10.1f}%{flag}")
+
+    for name in sorted(baseline.keys() ^ candidate.keys()):
+        print(f"{name:<55} only in {'baseline' if name in baseline else 'candidate'}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import json
+import random
+from datetime import datetime, timedelta
+from typing import List, Tuple
+import numpy as np
+import pandas as pd
+import pytz
+
+# Synthetic data generators for the benchmark suite.
+# Every generator takes a seed so that two runs (or two commits) benchmark the exact same workload.
+
+COINBASE_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+
+def random_walk_ticks(n: int, mid: float = 60000.0, tick_size: float = 0.01, levels: int = 20, seed: int = 42) -> List[Tuple[str, float, float, datetime]]:
+    """(bid_ask, price, quantity, event_time) ticks around a random-walking mid, roughly 10% of them deleting a level."""
+    rng = random.Random(seed)
+    event_time = datetime(2024, 8, 1, tzinfo=pytz.UTC)
+    ticks = []
+    for _ in range(n):
+        mid += rng.choice((-1, 0, 0, 1)) * tick_size
+        # A few ticks share the same event time, as they would within one exchange message
+        if rng.random() < 0.3:
+            event_time += timedelta(microseconds=rng.randint(100, 50000))
+        bid_ask = 'bid' if rng.random() < 0.5 else 'ask'
+        offset = rng.randint(1, levels) * tick_size
+        price = round(mid - offset if bid_ask == 'bid' else mid + offset, 2)
+        quantity = 0.0 if rng.random() < 0.1 else round(rng.uniform(0.001, 5.0), 6)
+        ticks.append((bid_ask, price, quantity, event_time))
+    return ticks
+
+
+def coinbase_l2_messages(n: int, updates_per_message: int = 5, ccy_1: str = "BTC", ccy_2: str = "USD", seed: int = 42) -> List[str]:
+    """Raw l2_data websocket payloads as sent by Coinbase Advanced Trade, first one being the snapshot."""
+    ticks = random_walk_ticks(n * updates_per_message, seed=seed)
+    messages = []
+    for i in range(n):
+        chunk = ticks[i * updates_per_message:(i + 1) * updates_per_message]
+        messages.append(json.dumps({
+            "channel": "l2_data",
+            "client_id": "",
+            "timestamp": chunk[-1][3].strftime(COINBASE_TIME_FORMAT),
+            "sequence_num": i,
+            "events": [{
+                "type": "snapshot" if i == 0 else "update",
+                "product_id": f"{ccy_1}-{ccy_2}",
+                "updates": [
+                    {
+                        "side": "bid" if bid_ask == 'bid' else "offer",
+                        "event_time": event_time.strftime(COINBASE_TIME_FORMAT),
+                        "price_level": f"{price:.2f}",
+                        "new_quantity": f"{quantity:.8f}",
+                    }
+                    for bid_ask, price, quantity, event_time in chunk
+                ],
+            }],
+        }))
+    return messages
+
+
+def kraken_book_messages(n: int, updates_per_message: int = 2, ccy_1: str = "BTC", ccy_2: str = "USD", seed: int = 42) -> List[str]:
+    """Raw book channel websocket payloads as sent by Kraken v2, first one being the snapshot."""
+    ticks = random_walk_ticks(n * updates_per_message, seed=seed)
+    messages = []
+    for i in range(n):
+        chunk = ticks[i * updates_per_message:(i + 1) * updates_per_message]
+        messages.append(json.dumps({
+            "channel": "book",
+            "type": "snapshot" if i == 0 else "update",
+            "data": [{
+                "symbol": f"{ccy_1}/{ccy_2}",
+                "bids": [{"price": price, "qty": quantity} for bid_ask, price, quantity, _ in chunk if bid_ask == 'bid'],
+                "asks": [{"price": price, "qty": quantity} for bid_ask, price, quantity, _ in chunk if bid_ask == 'ask'],
+                "checksum": 0,
+                "timestamp": chunk[-1][3].strftime(COINBASE_TIME_FORMAT),
+            }],
+        }))
+    return messages
+
+
+def order_book_rows(n: int, ccy_1: str = "BTC", ccy_2: str = "USD", exchange: str = "Coinbase", seed: int = 42) -> List[tuple]:
+    """Full order_book rows (identity repeated on every row), as inserted with db_helper.execute_many."""
+    rng = random.Random(seed)
+    event_time = datetime(2024, 8, 1, tzinfo=pytz.UTC)
+    mid = 60000.0
+    rows = []
+    for _ in range(n):
+        event_time += timedelta(milliseconds=rng.randint(1, 100))
+        mid += rng.choice((-1, 0, 1)) * 0.01
+        rows.append((event_time.isoformat(), ccy_1, ccy_2, rng.uniform(0.001, 5.0), round(mid - 0.005, 2), round(mid + 0.005, 2), rng.uniform(0.001, 5.0), exchange))
+    return rows
+
+
+def bbo_columns(n: int, seed: int = 42):
+    """BBO rows of one book as drained from its buffer (BboColumns), as inserted by OrderBook.flush_to_db."""
+    from market.bounded_buffer import BboColumns
+
+    rng = random.Random(seed)
+    event_time = datetime(2024, 8, 1, tzinfo=pytz.UTC).timestamp()
+    mid = 60000.0
+    columns = BboColumns()
+    for _ in range(n):
+        event_time += rng.randint(1, 100) / 1000
+        mid += rng.choice((-1, 0, 1)) * 0.01
+        columns.append(event_time, rng.uniform(0.001, 5.0), round(mid - 0.005, 2), round(mid + 0.005, 2), rng.uniform(0.001, 5.0))
+    return columns
+
+
+def bid_ask_dataframe(hours: float, updates_per_second: float = 20, exchanges: Tuple[str, ...] = ("Coinbase", "Kraken"), coins: Tuple[str, ...] = ("BTC", "ETH"), seed: int = 42) -> pd.DataFrame:
+    """Raw order_book rows as returned by the get_data query (indexed by timestamp) before any resampling."""
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2024-08-01", tz="UTC")
+    n = int(hours * 3600 * updates_per_second)
+    frames = []
+    for exchange in exchanges:
+        for coin in coins:
+            offsets = np.sort(rng.uniform(0, hours * 3600, n))
+            mid = 60000.0 + np.cumsum(rng.choice([-0.01, 0.0, 0.01], n))
+            half_spread = rng.choice([0.005, 0.05], n)
+            frames.append(pd.DataFrame({
+                'timestamp': start + pd.to_timedelta(offsets, unit='s'),
+                'exchange': exchange,
+                'currency_1': coin,
+                'currency_2': 'USD',
+                'bid_q': rng.uniform(0.001, 5.0, n),
+                'bid': mid - half_spread,
+                'ask': mid + half_spread,
+                'ask_q': rng.uniform(0.001, 5.0, n),
+            }))
+    bid_ask_df = pd.concat(frames).sort_values('timestamp').set_index('timestamp')
+    return bid_ask_df
+
+
+def price_series(seconds: int, seed: int = 42) -> pd.Series:
+    """Per second random walk price, as charted by the web GUI after resampling."""
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2024-08-01", periods=seconds, freq="s", tz="UTC")
+    return pd.Series(60000.0 + rng.normal(0, 0.5, seconds).cumsum(), index=index)
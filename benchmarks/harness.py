@@ -0,0 +1,72 @@
+import gc
+import time
+from dataclasses import dataclass, asdict
+from typing import Callable, Iterable, List
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    iterations: int
+    items_per_iteration: int
+    total_seconds: float
+    ops_per_sec: float
+    items_per_sec: float
+    mean_us: float
+    p50_us: float
+    p90_us: float
+    p99_us: float
+    max_us: float
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def percentile(sorted_samples: List[float], pct: float) -> float:
+    # Nearest-rank percentile, samples must already be sorted
+    if not sorted_samples:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(sorted_samples) + 0.5)) - 1, 0)
+    return sorted_samples[min(rank, len(sorted_samples) - 1)]
+
+
+def run_benchmark(name: str, operation: Callable[[object], None], inputs: Iterable, items_per_iteration: int = 1, warmup: int = 10) -> BenchmarkResult:
+    """
+    Times operation(input) for each input and returns throughput and latency percentiles.
+    The inputs are materialised beforehand so that generating them is never part of the measurement.
+    """
+    inputs = list(inputs)
+    for item in inputs[:warmup]:
+        operation(item)
+
+    samples_ns = []
+    perf_counter_ns = time.perf_counter_ns
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        t0 = perf_counter_ns()
+        for item in inputs:
+            start = perf_counter_ns()
+            operation(item)
+            samples_ns.append(perf_counter_ns() - start)
+        total_seconds = (perf_counter_ns() - t0) / 1e9
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    samples_us = sorted(s / 1000 for s in samples_ns)
+    iterations = len(samples_us)
+    busy_seconds = sum(samples_ns) / 1e9 or float("nan")
+    return BenchmarkResult(
+        name=name,
+        iterations=iterations,
+        items_per_iteration=items_per_iteration,
+        total_seconds=total_seconds,
+        ops_per_sec=iterations / busy_seconds,
+        items_per_sec=iterations * items_per_iteration / busy_seconds,
+        mean_us=sum(samples_us) / iterations if iterations else 0.0,
+        p50_us=percentile(samples_us, 50),
+        p90_us=percentile(samples_us, 90),
+        p99_us=percentile(samples_us, 99),
+        max_us=samples_us[-1] if samples_us else 0.0,
+    )
@@ -0,0 +1,213 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import pytz
+
+from benchmarks.data_generators import random_walk_ticks, coinbase_l2_messages, kraken_book_messages, order_book_rows, bbo_columns, bid_ask_dataframe, price_series
+from benchmarks.harness import BenchmarkResult, run_benchmark
+
+# Usage (from the project directory, with the same PYTHONPATH as main.py):
+#   python benchmarks/run_benchmarks.py --output bench_output.json
+#   python benchmarks/run_benchmarks.py --only order_book feed_handler --skip-db
+# Then compare two runs with benchmarks/compare.py
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# streamlit_helper is imported the same way streamlit_app.py does it
+sys.path.append(os.path.join(base_dir, "web_gui"))
+
+
+def make_order_book(ccy_1: str = "BTC", ccy_2: str = "USD", exchange: str = "Benchmark"):
+    from market import FullOrderBook
+
+    # In memory only: no thread or writer is started, synthetic rows never make it to the DB or a checkpoint
+    order_book = FullOrderBook(ccy_1, ccy_2, exchange, persist=False)
+    order_book.snapshot_complete = True
+    return order_book
+
+
+def make_feed_handler(feed_handler_class, ccy_1: str = "BTC", ccy_2: str = "USD"):
+    # Bypass __init__: on_message only needs the order book, not API keys or a websocket
+    feed_handler = feed_handler_class.__new__(feed_handler_class)
+    feed_handler.ccy_1 = ccy_1
+    feed_handler.ccy_2 = ccy_2
+    feed_handler.exchange = "Benchmark"
+    feed_handler.order_book = make_order_book(ccy_1, ccy_2)
+    return feed_handler
+
+
+def bench_register_tick(scale: float) -> List[BenchmarkResult]:
+    order_book = make_order_book()
+    ticks = random_walk_ticks(int(200_000 * scale))
+
+    def operation(tick):
+        order_book.register_tick(bid_ask=tick[0], price=tick[1], quantity=tick[2], event_time=tick[3])
+
+    result = run_benchmark("order_book.register_tick", operation, ticks)
+    order_book._bid_ask_history.clear()
+    return [result]
+
+
+def bench_register_best_bid_offer(scale: float) -> List[BenchmarkResult]:
+    order_book = make_order_book()
+    for bid_ask, price, quantity, event_time in random_walk_ticks(1000):
+        order_book.register_tick(bid_ask=bid_ask, price=price, quantity=quantity, event_time=event_time)
+    best_bid = next(iter(order_book._bids))
+    quantities = [0.5 + (i % 100) / 1000 for i in range(int(200_000 * scale))]
+
+    # Flicker the best bid size, which is what most BBO changes look like on a quiet market
+    def operation(quantity):
+        order_book._bids[best_bid] = quantity
+        order_book.register_best_bid_offer()
+
+    result = run_benchmark("order_book.register_best_bid_offer", operation, quantities)
+    order_book._bid_ask_history.clear()
+    return [result]
+
+
+def bench_feed_handlers(scale: float) -> List[BenchmarkResult]:
+    from feed_handlers import CoinbaseFeedHandler, KrakenFeedHandler
+
+    results = []
+    coinbase_updates, kraken_updates = 5, 2
+    for feed_handler_class, messages, updates in (
+        (CoinbaseFeedHandler, coinbase_l2_messages(int(20_000 * scale), coinbase_updates), coinbase_updates),
+        (KrakenFeedHandler, kraken_book_messages(int(20_000 * scale), kraken_updates), kraken_updates),
+    ):
+        feed_handler = make_feed_handler(feed_handler_class)
+        # Apply the snapshot outside of the measurement
+        feed_handler.on_message(None, messages[0])
+        results.append(run_benchmark(f"feed_handler.{feed_handler_class.__name__}.on_message",
+                                     lambda message: feed_handler.on_message(None, message),
+                                     messages[1:], items_per_iteration=updates))
+        feed_handler.order_book._bid_ask_history.clear()
+    return results
+
+
+def bench_execute_many(scale: float) -> List[BenchmarkResult]:
+    from database import db_helper
+
+    batch_size = 1000
+    batches = [order_book_rows(batch_size, seed=seed) for seed in range(max(int(50 * scale), 1))]
+    # Temporary table: dropped with the session, never pollutes order_book
+    db_helper.execute("CREATE TEMP TABLE IF NOT EXISTS order_book_benchmark (LIKE order_book INCLUDING DEFAULTS)")
+    insert_query = "INSERT INTO order_book_benchmark (timestamp, currency_1, currency_2, bid_q, bid, ask, ask_q, exchange) VALUES "
+    try:
+        result = run_benchmark("db_helper.execute_many", lambda batch: db_helper.execute_many(insert_query, batch),
+                               batches, items_per_iteration=batch_size, warmup=2)
+    finally:
+        db_helper.execute("DROP TABLE IF EXISTS order_book_benchmark")
+    return [result]
+
+
+def bench_flush_to_db(scale: float) -> List[BenchmarkResult]:
+    from database import db_helper
+
+    batch_size = 1000
+    order_book = make_order_book()
+    batches = [bbo_columns(batch_size, seed=seed) for seed in range(max(int(50 * scale), 1))]
+    warmup = 2
+    # Temporary table named order_book: it shadows the real one for the (shared) connection, so flush_to_db's insert
+    # goes to it as is, and it's dropped with the session
+    db_helper.execute("CREATE TEMP TABLE order_book (LIKE order_book INCLUDING DEFAULTS)")
+    try:
+        result = run_benchmark("order_book.flush_to_db", lambda batch: order_book.flush_to_db([batch]), batches,
+                               items_per_iteration=batch_size, warmup=warmup)
+        # flush_to_db logs and carries on when an insert fails, which would look very fast
+        expected = batch_size * (len(batches) + min(warmup, len(batches)))
+        inserted = db_helper.fetch_all("SELECT count(*) FROM pg_temp.order_book")[0][0]
+        if inserted != expected:
+            raise RuntimeError(f"flush_to_db inserted {inserted} rows, {expected} expected")
+    finally:
+        db_helper.execute("DROP TABLE IF EXISTS pg_temp.order_book")
+    return [result]
+
+
+def bench_get_data_resampling(scale: float) -> List[BenchmarkResult]:
+    from streamlit_helper import resample_bid_ask
+
+    hours = 0.25 * scale
+    raw_df = bid_ask_dataframe(hours=hours)
+    return [run_benchmark("streamlit_helper.resample_bid_ask", resample_bid_ask, [raw_df] * 5,
+                          items_per_iteration=len(raw_df), warmup=1)]
+
+
+def bench_arb_figures(scale: float) -> List[BenchmarkResult]:
+    from streamlit_helper import resample_bid_ask, build_arb_figures
+
+    resampled_df = resample_bid_ask(bid_ask_dataframe(hours=0.25 * scale))
+    exchanges = sorted(resampled_df['exchange'].unique())
+    taking_fees = {exchange: 0.4 for exchange in exchanges}
+    return [run_benchmark("streamlit_helper.build_arb_figures",
+                          lambda df: build_arb_figures(df, exchanges, "BTC", taking_fees),
+                          [resampled_df] * 5, items_per_iteration=len(resampled_df), warmup=1)]
+
+
+def bench_decimation(scale: float) -> List[BenchmarkResult]:
+    from streamlit_helper import decimate
+
+    # A day of per second points, decimated to what a chart displays
+    series = price_series(int(86_400 * scale))
+    return [run_benchmark("streamlit_helper.decimate", lambda s: decimate(s, 2000), [series] * 20,
+                          items_per_iteration=len(series), warmup=2)]
+
+
+BENCHMARKS: Dict[str, Callable[[float], List[BenchmarkResult]]] = {
+    "order_book": lambda scale: bench_register_tick(scale) + bench_register_best_bid_offer(scale),
+    "feed_handler": bench_feed_handlers,
+    "db": lambda scale: bench_execute_many(scale) + bench_flush_to_db(scale),
+    "resampling": bench_get_data_resampling,
+    "arb_figures": bench_arb_figures,
+    "decimation": bench_decimation,
+}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=base_dir, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ingestion and analytics hot paths")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS.keys(), help="Benchmark groups to run (default: all)")
+    parser.add_argument("--skip-db", action="store_true", help="Skip the benchmarks requiring a local Postgres")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier applied to every workload size")
+    parser.add_argument("--output", help="JSON file to write the results to (default: stdout)")
+    args = parser.parse_args()
+
+    groups = args.only or list(BENCHMARKS.keys())
+    if args.skip_db:
+        groups = [group for group in groups if group != "db"]
+
+    results = []
+    for group in groups:
+        for result in BENCHMARKS[group](args.scale):
+            print(f"{result.name:<55} {result.ops_per_sec:>12,.0f} ops/s  p50 {result.p50_us:>9.1f}us  p99 {result.p99_us:>9.1f}us", file=sys.stderr)
+            results.append(result.to_dict())
+
+    report = {
+        "metadata": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(pytz.UTC).isoformat(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "scale": args.scale,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
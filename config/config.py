@@ -35,9 +35,14 @@ class NestedConfig:
 
 class Config:
     def __init__(self, config_file: str):
-        with open(config_file, "r") as file:
-            self._config = yaml.safe_load(file)
-        self._nested_config = NestedConfig(self._config)
+        self.config_file = config_file
+        self.reload()
+
+    def reload(self):
+        # Swaps in the new values at once, threads reading the config never see a half loaded file
+        with open(self.config_file, "r") as file:
+            loaded_config = yaml.safe_load(file)
+        self._config, self._nested_config = loaded_config, NestedConfig(loaded_config)
 
     def __getattr__(self, item):
         return getattr(self._nested_config, item)
@@ -1,3 +1,6 @@
-from .db_helper import execute_many
+from .db_helper import execute_many, stream_rows, iter_chunks, export_query, init_schema
+from .l2_store import L2Recorder, reconstruct_order_book
+from .arb_episodes import store_episodes, count_episodes, fetch_episodes
 
-__all__ = ["execute_many"]
+__all__ = ["init_schema", "execute_many", "stream_rows", "iter_chunks", "export_query", "L2Recorder", "reconstruct_order_book",
+           "store_episodes", "count_episodes", "fetch_episodes"]
@@ -0,0 +1,72 @@
+from datetime import datetime
+from typing import Iterable, List, Optional
+import pytz
+from database import db_helper
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Arbitrage episodes (see market.arb_detector), one row per episode in arb_episodes. Indexed by coin and start time, so
+# counting or listing the episodes of a coin over a period doesn't scan the order_book history.
+# source tells episodes detected live (main.py) from those found over the history (backtest/find_arb_episodes.py).
+
+LIVE, BATCH = "live", "batch"
+
+EPISODE_COLUMNS = ["currency_1", "currency_2", "sell_exchange", "buy_exchange", "start_time", "end_time", "duration_ms",
+                   "peak_time", "peak_edge_bps", "peak_profit", "peak_bid", "peak_bid_q", "peak_ask", "peak_ask_q",
+                   "updates", "source"]
+
+
+def _utc(timestamp: datetime) -> datetime:
+    # Timestamps are stored as naive UTC, like the order_book ones
+    return timestamp.astimezone(pytz.UTC).replace(tzinfo=None) if timestamp.tzinfo else timestamp
+
+
+def store_episodes(episodes: Iterable, source: str) -> int:
+    rows = [(episode.currency_1, episode.currency_2, episode.sell_exchange, episode.buy_exchange,
+             _utc(episode.start_time), _utc(episode.end_time), episode.duration.total_seconds() * 1000,
+             _utc(episode.peak_time), episode.peak_edge_bps, episode.peak_profit, episode.peak_bid, episode.peak_bid_q,
+             episode.peak_ask, episode.peak_ask_q, episode.updates, source) for episode in episodes]
+    if rows:
+        db_helper.execute_many(f"INSERT INTO arb_episodes ({', '.join(EPISODE_COLUMNS)}) VALUES ", rows)
+        logger.debug(f"{len(rows)} {source} arb episodes stored")
+    return len(rows)
+
+
+def _filters(currency_1: Optional[str], start: Optional[datetime], end: Optional[datetime], min_edge_bps: float,
+             source: Optional[str], currency_2: Optional[str]):
+    clauses, params = ["peak_edge_bps >= %s"], [min_edge_bps]
+    for clause, value in (("currency_1 = %s", currency_1), ("start_time >= %s", start), ("start_time < %s", end),
+                          ("source = %s", source), ("currency_2 = %s", currency_2)):
+        if value is not None:
+            clauses.append(clause)
+            params.append(_utc(value) if isinstance(value, datetime) else value)
+    return " AND ".join(clauses), tuple(params)
+
+
+def count_episodes(currency_1: str = None, start: datetime = None, end: datetime = None, min_edge_bps: float = 0.0,
+                   source: str = None, currency_2: str = None) -> int:
+    """E.g. count_episodes("SOL", start=a_week_ago, min_edge_bps=5): episodes starting in [start, end)."""
+    where, params = _filters(currency_1, start, end, min_edge_bps, source, currency_2)
+    return db_helper.fetch_all(f"SELECT count(*) FROM arb_episodes WHERE {where}", params)[0][0]
+
+
+def fetch_episodes(currency_1: str = None, start: datetime = None, end: datetime = None, min_edge_bps: float = 0.0,
+                   source: str = None, currency_2: str = None, limit: int = 10_000) -> List[dict]:
+    """Episodes starting in [start, end), most recent first."""
+    where, params = _filters(currency_1, start, end, min_edge_bps, source, currency_2)
+    rows = db_helper.fetch_all(
+        f"SELECT {', '.join(EPISODE_COLUMNS)} FROM arb_episodes WHERE {where} ORDER BY start_time DESC LIMIT %s",
+        params + (limit,),
+    )
+    return [dict(zip(EPISODE_COLUMNS, row)) for row in rows]
+
+
+def delete_episodes(source: str, start: datetime, end: datetime, coins: List[str] = None) -> None:
+    """Clears the episodes of a period before detecting them again (batch runs over the same history)."""
+    query = "DELETE FROM arb_episodes WHERE source = %s AND start_time >= %s AND start_time < %s"
+    params = (source, _utc(start), _utc(end))
+    if coins:
+        query += " AND currency_1 = ANY(%s)"
+        params += (list(coins),)
+    db_helper.execute(query, params)
@@ -1,3 +1,9 @@
+-- Checksums of the versions of this script applied so far, see db_helper.init_schema
+CREATE TABLE IF NOT EXISTS schema_version (
+    checksum TEXT PRIMARY KEY,
+    applied_at TIMESTAMP DEFAULT (now() AT TIME ZONE 'UTC')
+);
+
 CREATE TABLE IF NOT EXISTS order_book (
     id BIGSERIAL PRIMARY KEY,
     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -10,6 +16,9 @@ CREATE TABLE IF NOT EXISTS order_book (
     exchange TEXT NOT NULL
 );
 
+-- Per book time range scans (backtests, history exports)
+CREATE INDEX IF NOT EXISTS order_book_book_time_idx ON order_book (exchange, currency_1, currency_2, timestamp, id);
+
 CREATE TABLE IF NOT EXISTS exchanges (
     exchange_id SERIAL PRIMARY KEY,
     exchange VARCHAR(255) NOT NULL UNIQUE
@@ -20,6 +29,84 @@ CREATE TABLE IF NOT EXISTS currencies (
     currency VARCHAR(255) NOT NULL UNIQUE
 );
 
+-- Full depth storage (see database/l2_store.py): compressed blocks of level deltas, and periodic full snapshots
+CREATE TABLE IF NOT EXISTS l2_deltas (
+    id BIGSERIAL PRIMARY KEY,
+    start_time TIMESTAMP NOT NULL,
+    end_time TIMESTAMP NOT NULL,
+    exchange TEXT NOT NULL,
+    currency_1 TEXT NOT NULL,
+    currency_2 TEXT NOT NULL,
+    n_deltas INTEGER NOT NULL,
+    price_decimals SMALLINT NOT NULL,
+    qty_decimals SMALLINT NOT NULL,
+    payload BYTEA NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS l2_deltas_book_time_idx ON l2_deltas (exchange, currency_1, currency_2, start_time);
+
+CREATE TABLE IF NOT EXISTS l2_snapshots (
+    id BIGSERIAL PRIMARY KEY,
+    timestamp TIMESTAMP NOT NULL,
+    exchange TEXT NOT NULL,
+    currency_1 TEXT NOT NULL,
+    currency_2 TEXT NOT NULL,
+    depth INTEGER NOT NULL,
+    price_decimals SMALLINT NOT NULL,
+    qty_decimals SMALLINT NOT NULL,
+    payload BYTEA NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS l2_snapshots_book_time_idx ON l2_snapshots (exchange, currency_1, currency_2, timestamp);
+
+-- Arbitrage episodes (see market/arb_detector.py): buying on buy_exchange and selling on sell_exchange was profitable,
+-- net of taking fees, from start_time to end_time. Peak values are the ones at the best point of the episode.
+CREATE TABLE IF NOT EXISTS arb_episodes (
+    id BIGSERIAL PRIMARY KEY,
+    currency_1 TEXT NOT NULL,
+    currency_2 TEXT NOT NULL,
+    sell_exchange TEXT NOT NULL,
+    buy_exchange TEXT NOT NULL,
+    start_time TIMESTAMP NOT NULL,
+    end_time TIMESTAMP NOT NULL,
+    duration_ms DOUBLE PRECISION NOT NULL,
+    peak_time TIMESTAMP NOT NULL,
+    peak_edge_bps DOUBLE PRECISION NOT NULL,
+    peak_profit DOUBLE PRECISION NOT NULL,
+    peak_bid DOUBLE PRECISION NOT NULL,
+    peak_bid_q DOUBLE PRECISION NOT NULL,
+    peak_ask DOUBLE PRECISION NOT NULL,
+    peak_ask_q DOUBLE PRECISION NOT NULL,
+    updates INTEGER NOT NULL,
+    source TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS arb_episodes_currency_time_idx ON arb_episodes (currency_1, start_time, peak_edge_bps);
+CREATE INDEX IF NOT EXISTS arb_episodes_time_idx ON arb_episodes (start_time);
+
+-- Per minute top of book statistics of each book (see market/book_stats.py)
+CREATE TABLE IF NOT EXISTS book_stats_1m (
+    id BIGSERIAL PRIMARY KEY,
+    minute TIMESTAMP NOT NULL,
+    exchange TEXT NOT NULL,
+    currency_1 TEXT NOT NULL,
+    currency_2 TEXT NOT NULL,
+    updates INTEGER NOT NULL,
+    spread_bps_mean DOUBLE PRECISION,
+    spread_bps_std DOUBLE PRECISION,
+    spread_bps_min DOUBLE PRECISION,
+    spread_bps_max DOUBLE PRECISION,
+    mid_open DOUBLE PRECISION,
+    mid_close DOUBLE PRECISION,
+    mid_volatility_bps DOUBLE PRECISION,
+    imbalance_mean DOUBLE PRECISION,
+    imbalance_std DOUBLE PRECISION,
+    bid_q_mean DOUBLE PRECISION,
+    ask_q_mean DOUBLE PRECISION
+);
+
+CREATE INDEX IF NOT EXISTS book_stats_1m_currency_minute_idx ON book_stats_1m (currency_1, minute);
+
 
 /* TODO: change to this:
 
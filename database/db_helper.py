@@ -1,12 +1,22 @@
 from crypto_arb_finder.config import config, secrets
 from logger import get_logger
+import csv
+import hashlib
 import os
+import time
+from datetime import datetime
+import uuid
 import psycopg2
 from threading import Lock, Thread
+from typing import Iterator, List, Tuple
 
 logger = get_logger(__name__)
 
 class Database:
+    """
+    Shared autocommit connection, opened on first use rather than at import.
+    The first connection also makes sure the schema is up to date (see init_schema) unless database.auto_schema is off.
+    """
 
     _instance = None
     _lock = Lock()
@@ -21,22 +31,60 @@ class Database:
         return cls._instance
 
     def __init__(self):
-        self.conn = psycopg2.connect(database=config.database.db_name,
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    t0 = time.perf_counter()
+                    conn = self.new_connection()
+                    conn.autocommit = True
+                    if config.get("database.auto_schema", True):
+                        init_schema(conn)
+                    self._conn = conn
+                    logger.info(f"Connected to {config.database.db_name} in {(time.perf_counter() - t0) * 1000:.0f}ms")
+        return self._conn
+
+    @staticmethod
+    def new_connection():
+        return psycopg2.connect(database=config.database.db_name,
                             host=config.database.db_host,
                             user=config.database.db_user,
                             password=secrets.database_password,
                             port=config.database.db_port)
-        self.conn.autocommit = True
 
-        build_db_path = os.path.expanduser(config.database.build_sql_file_path)
-        try:
-            with open(build_db_path, "r") as file:
-                sql_script = file.read()
-            with self.conn.cursor() as cursor:
-                cursor.execute(sql_script)
-            logger.info(f"Executed build DB SQL script from {build_db_path} successfully") 
-        except FileNotFoundError as e:
-            logger.exception(f"Error: SQL file not found: {e}")
+
+def init_schema(conn=None, force: bool = False) -> bool:
+    """
+    Runs build_database.sql, unless this exact version of it was already applied (its checksum is recorded in
+    schema_version) and force isn't set. Returns whether the script was run.
+    """
+    conn = conn or database.conn
+    build_db_path = os.path.expanduser(config.database.build_sql_file_path)
+    try:
+        with open(build_db_path, "rb") as file:
+            sql_script = file.read()
+    except FileNotFoundError as e:
+        logger.exception(f"Error: SQL file not found: {e}")
+        return False
+    checksum = hashlib.sha256(sql_script).hexdigest()
+    with conn.cursor() as cursor:
+        if not force:
+            cursor.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+            if cursor.fetchone()[0]:
+                cursor.execute("SELECT 1 FROM schema_version WHERE checksum = %s", (checksum,))
+                if cursor.fetchone():
+                    logger.debug(f"Schema up to date ({checksum[:12]})")
+                    return False
+        cursor.execute(sql_script.decode("utf-8"))
+        cursor.execute(
+            "INSERT INTO schema_version (checksum) VALUES (%s) ON CONFLICT (checksum) DO UPDATE SET applied_at = now() AT TIME ZONE 'UTC'",
+            (checksum,),
+        )
+    logger.info(f"Executed build DB SQL script from {build_db_path} successfully ({checksum[:12]})")
+    return True
 
 
 database = Database()
@@ -46,7 +94,85 @@ def execute_many(query: str, args: list):
         mogrified_args = ','.join(cursor.mogrify("(" + ", ".join(["%s"] * len(args[0])) + ")", i).decode("utf-8") for i in args)
         cursor.execute(query + mogrified_args)
 
-def execute(query:str):
+def execute(query:str, params: tuple = None):
     with database.conn.cursor() as cursor:
-        cursor.execute(query)
+        cursor.execute(query, params)
+
+def fetch_all(query: str, params: tuple = None) -> list:
+    with database.conn.cursor() as cursor:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+# Streaming reads: named (server-side) cursors keep the result set in Postgres and only fetch_size rows at a time
+# make it to the client, so memory use doesn't depend on the size of the result.
+# Each stream uses its own connection (named cursors need a transaction, the shared connection is in autocommit).
 
+def stream_rows(query: str, params: tuple = None, fetch_size: int = None) -> Iterator[Tuple[List[str], list]]:
+    """Yields (column names, rows) chunks of at most fetch_size rows."""
+    fetch_size = fetch_size or config.get("database.fetch_size", 10000)
+    conn = database.new_connection()
+    try:
+        with conn.cursor(name=f"stream_{uuid.uuid4().hex}") as cursor:
+            cursor.itersize = fetch_size
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                yield [column.name for column in cursor.description], rows
+    finally:
+        conn.close()
+
+
+def iter_chunks(query: str, params: tuple = None, fetch_size: int = None, as_dataframe: bool = False):
+    """Yields column oriented chunks: {column: numpy array} dicts, or pandas DataFrames if as_dataframe is set."""
+    import numpy as np
+    import pandas as pd
+
+    for columns, rows in stream_rows(query, params, fetch_size):
+        if as_dataframe:
+            yield pd.DataFrame.from_records(rows, columns=columns)
+        else:
+            chunk = {}
+            for column, values in zip(columns, zip(*rows)):
+                # TIMESTAMP columns come back as naive datetimes, which numpy would otherwise keep as objects
+                chunk[column] = np.asarray(values, dtype="datetime64[us]") if isinstance(values[0], datetime) else np.asarray(values)
+            yield chunk
+
+
+def export_query(query: str, path: str, params: tuple = None, file_format: str = None, fetch_size: int = None) -> int:
+    """
+    Writes the result of query straight to a CSV or Parquet file (format guessed from the extension by default),
+    chunk by chunk. Parquet requires pyarrow. Returns the number of rows written.
+    """
+    file_format = file_format or os.path.splitext(path)[1].lstrip(".").lower()
+    rows_written = 0
+    if file_format == "csv":
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            for columns, rows in stream_rows(query, params, fetch_size):
+                if rows_written == 0:
+                    writer.writerow(columns)
+                writer.writerows(rows)
+                rows_written += len(rows)
+    elif file_format == "parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet exports require pyarrow (pip install pyarrow)") from e
+        writer = None
+        try:
+            for chunk in iter_chunks(query, params, fetch_size, as_dataframe=True):
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+                rows_written += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        raise ValueError(f"Unsupported export format: {file_format}")
+    logger.info(f"Exported {rows_written} rows to {path}")
+    return rows_written
@@ -0,0 +1,34 @@
+import argparse
+from datetime import datetime
+from database import db_helper
+
+# Usage (same PYTHONPATH as main.py):
+#   python database/export_history.py --start 2024-08-01 --end 2024-08-02 --output order_book.parquet
+#   python database/export_history.py --start 2024-08-01 --end 2024-08-02 --exchange Kraken --coin BTC --output kraken_btc.csv
+# Rows are streamed from a server-side cursor straight to the file, memory use doesn't depend on the time range.
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export order_book history to CSV or Parquet")
+    parser.add_argument("--start", required=True, type=datetime.fromisoformat)
+    parser.add_argument("--end", required=True, type=datetime.fromisoformat)
+    parser.add_argument("--exchange")
+    parser.add_argument("--coin")
+    parser.add_argument("--output", required=True, help="Output file, .csv or .parquet")
+    parser.add_argument("--fetch-size", type=int)
+    args = parser.parse_args()
+
+    query = "SELECT timestamp, exchange, currency_1, currency_2, bid_q, bid, ask, ask_q FROM order_book WHERE timestamp >= %s AND timestamp < %s"
+    params = [args.start, args.end]
+    if args.exchange:
+        query += " AND exchange = %s"
+        params.append(args.exchange)
+    if args.coin:
+        query += " AND currency_1 = %s"
+        params.append(args.coin)
+    query += " ORDER BY timestamp, id"
+    db_helper.export_query(query, args.output, tuple(params), fetch_size=args.fetch_size)
+
+
+if __name__ == "__main__":
+    main()
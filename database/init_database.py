@@ -0,0 +1,23 @@
+import argparse
+from database import db_helper
+
+# Usage (same PYTHONPATH as main.py):
+#   python database/init_database.py            # runs build_database.sql if it changed since last applied
+#   python database/init_database.py --force    # runs it regardless
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create/update the database schema from build_database.sql")
+    parser.add_argument("--force", action="store_true", help="Run the script even if this version was already applied")
+    args = parser.parse_args()
+    conn = db_helper.Database.new_connection()
+    conn.autocommit = True
+    try:
+        applied = db_helper.init_schema(conn, force=args.force)
+    finally:
+        conn.close()
+    print("Schema updated" if applied else "Schema already up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+from array import array
+from datetime import datetime
+from itertools import accumulate
+from threading import Lock, Thread
+from typing import Dict, List, Optional, Tuple
+import struct
+import time
+import zlib
+import pytz
+from sortedcontainers import SortedDict
+from config import config
+from database import db_helper
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Full depth (L2) tick store.
+# Every level update applied to a FullOrderBook is recorded as a delta (time, side, price, quantity), prices and
+# quantities as integers (ticks/units of 10^-decimals), times in microseconds since epoch. Blocks of deltas are
+# delta-encoded column by column and zlib compressed before being written to l2_deltas. Full snapshots of the book are
+# written to l2_snapshots every snapshot_interval_s, so that rebuilding the book at any time only replays the deltas
+# since the closest snapshot.
+
+BID, ASK, CLEAR = 0, 1, 2
+
+DELTA_HEADER = struct.Struct("<Iq")  # number of deltas, time of the first delta (us)
+SNAPSHOT_HEADER = struct.Struct("<II")  # number of bid levels, number of ask levels
+
+
+def to_us(event_time: datetime) -> int:
+    return round(event_time.timestamp() * 1_000_000)
+
+
+def from_us(timestamp_us: int) -> datetime:
+    return datetime.fromtimestamp(timestamp_us / 1_000_000, pytz.UTC)
+
+
+def _diff(values: List[int]) -> array:
+    encoded = array("q", values)
+    for i in range(len(values) - 1, 0, -1):
+        encoded[i] -= encoded[i - 1]
+    return encoded
+
+
+def encode_deltas(deltas: List[Tuple[int, int, int, int]]) -> bytes:
+    """Encodes (time_us, side, price_ticks, qty_units) deltas, times being non-decreasing."""
+    times, sides, prices, quantities = zip(*deltas)
+    time_deltas = _diff(list(times))
+    time_deltas[0] = 0
+    payload = (DELTA_HEADER.pack(len(deltas), times[0]) + time_deltas.tobytes() + array("b", sides).tobytes()
+               + _diff(list(prices)).tobytes() + array("q", quantities).tobytes())
+    return zlib.compress(payload)
+
+
+def decode_deltas(payload: bytes) -> List[Tuple[int, int, int, int]]:
+    raw = zlib.decompress(payload)
+    n, first_time = DELTA_HEADER.unpack_from(raw)
+    offset = DELTA_HEADER.size
+    time_deltas = array("q", raw[offset:offset + 8 * n])
+    offset += 8 * n
+    sides = array("b", raw[offset:offset + n])
+    offset += n
+    price_deltas = array("q", raw[offset:offset + 8 * n])
+    offset += 8 * n
+    quantities = array("q", raw[offset:offset + 8 * n])
+    times = accumulate(time_deltas, initial=first_time)
+    next(times)
+    return list(zip(times, sides, accumulate(price_deltas), quantities))
+
+
+def encode_snapshot(bids: List[Tuple[int, int]], asks: List[Tuple[int, int]]) -> bytes:
+    """Encodes (price_ticks, qty_units) levels, bids from best (highest) and asks from best (lowest)."""
+    payload = SNAPSHOT_HEADER.pack(len(bids), len(asks))
+    for levels in (bids, asks):
+        if levels:
+            prices, quantities = zip(*levels)
+            payload += _diff(list(prices)).tobytes() + array("q", quantities).tobytes()
+    return zlib.compress(payload)
+
+
+def decode_snapshot(payload: bytes) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]:
+    raw = zlib.decompress(payload)
+    n_bids, n_asks = SNAPSHOT_HEADER.unpack_from(raw)
+    offset = SNAPSHOT_HEADER.size
+    sides = []
+    for n in (n_bids, n_asks):
+        prices = accumulate(array("q", raw[offset:offset + 8 * n]))
+        quantities = array("q", raw[offset + 8 * n:offset + 16 * n])
+        offset += 16 * n
+        sides.append(list(zip(prices, quantities)))
+    return sides[0], sides[1]
+
+
+class L2Recorder:
+    """
+    Records the level updates of one order book, and periodically a snapshot of it.
+    Recorders outlive order book resets (reconnects): a reset is recorded as a CLEAR delta.
+    """
+
+    _recorders: Dict[Tuple[str, str, str], "L2Recorder"] = {}
+    _recorders_lock = Lock()
+    _writer_thread: Optional[Thread] = None
+
+    def __init__(self, exchange: str, ccy_1: str, ccy_2: str):
+        self.exchange = exchange
+        self.ccy_1 = ccy_1
+        self.ccy_2 = ccy_2
+        self.price_decimals = config.get("order_book.l2_storage.price_decimals", 8)
+        self.qty_decimals = config.get("order_book.l2_storage.qty_decimals", 8)
+        self.snapshot_interval = config.get("order_book.l2_storage.snapshot_interval_s", 60)
+        self._price_scale = 10 ** self.price_decimals
+        self._qty_scale = 10 ** self.qty_decimals
+        self._lock = Lock()
+        # Filled on the feed handler thread, swapped out by the writer thread
+        self._deltas: List[tuple] = []
+        self._snapshots: List[tuple] = []
+        self._next_snapshot_time = 0.0
+
+    @classmethod
+    def for_book(cls, exchange: str, ccy_1: str, ccy_2: str) -> "L2Recorder":
+        key = (exchange, ccy_1, ccy_2)
+        with cls._recorders_lock:
+            if key not in cls._recorders:
+                cls._recorders[key] = cls(exchange, ccy_1, ccy_2)
+            if cls._writer_thread is None:
+                cls._writer_thread = Thread(target=cls.periodic_flush, name="l2_store_writer")
+                cls._writer_thread.daemon = True
+                cls._writer_thread.start()
+            return cls._recorders[key]
+
+    @classmethod
+    def release(cls, exchange: str, ccy_1: str, ccy_2: str) -> None:
+        # Flushes and forgets the recorder of a book that is being removed
+        with cls._recorders_lock:
+            recorder = cls._recorders.pop((exchange, ccy_1, ccy_2), None)
+        if recorder is not None:
+            recorder.flush()
+
+    # Called on the feed handler thread, must stay cheap: conversion and encoding happen on the writer thread
+    def record(self, side: int, price: float, quantity: float, event_time: datetime) -> None:
+        with self._lock:
+            self._deltas.append((event_time, side, price, quantity))
+
+    def record_clear(self, event_time: datetime) -> None:
+        self.record(CLEAR, 0.0, 0.0, event_time)
+
+    def snapshot_due(self, event_time: datetime) -> bool:
+        return event_time.timestamp() >= self._next_snapshot_time
+
+    def record_snapshot(self, bids: SortedDict, asks: SortedDict, depth: int, event_time: datetime) -> None:
+        # Must be called between two event times: the snapshot holds every delta up to (and including) event_time
+        with self._lock:
+            self._snapshots.append((event_time, depth, list(bids.items()), list(asks.items())))
+        self._next_snapshot_time = event_time.timestamp() + self.snapshot_interval
+
+    def flush(self) -> None:
+        with self._lock:
+            deltas, self._deltas = self._deltas, []
+            snapshots, self._snapshots = self._snapshots, []
+        if not deltas and not snapshots:
+            return
+
+        insert_time = time.perf_counter()
+        price_scale, qty_scale = self._price_scale, self._qty_scale
+        if deltas:
+            encoded = [(to_us(event_time), side, round(price * price_scale), round(quantity * qty_scale))
+                       for event_time, side, price, quantity in deltas]
+            payload = encode_deltas(encoded)
+            db_helper.execute_many(
+                "INSERT INTO l2_deltas (start_time, end_time, exchange, currency_1, currency_2, n_deltas, price_decimals, qty_decimals, payload) VALUES ",
+                [(from_us(encoded[0][0]).replace(tzinfo=None), from_us(encoded[-1][0]).replace(tzinfo=None),
+                  self.exchange, self.ccy_1, self.ccy_2, len(encoded), self.price_decimals, self.qty_decimals, payload)],
+            )
+            logger.debug(f"{self}: {len(encoded)} deltas stored in {len(payload)} bytes")
+        if snapshots:
+            rows = []
+            for event_time, depth, bids, asks in snapshots:
+                payload = encode_snapshot([(round(p * price_scale), round(q * qty_scale)) for p, q in bids],
+                                          [(round(p * price_scale), round(q * qty_scale)) for p, q in asks])
+                rows.append((event_time.astimezone(pytz.UTC).replace(tzinfo=None), self.exchange, self.ccy_1, self.ccy_2,
+                             depth, self.price_decimals, self.qty_decimals, payload))
+            db_helper.execute_many(
+                "INSERT INTO l2_snapshots (timestamp, exchange, currency_1, currency_2, depth, price_decimals, qty_decimals, payload) VALUES ",
+                rows,
+            )
+        logger.debug(f"{self}: flushed in {(time.perf_counter() - insert_time) * 1000:.2f}ms")
+
+    @classmethod
+    def periodic_flush(cls):
+        flush_interval = config.get("order_book.l2_storage.flush_interval_s", 20)
+        while True:
+            time.sleep(flush_interval)
+            with cls._recorders_lock:
+                recorders = list(cls._recorders.values())
+            for recorder in recorders:
+                try:
+                    recorder.flush()
+                except Exception as e:
+                    logger.exception(f"Error while flushing {recorder}: {e}")
+
+    # Dunder methods...
+    def __str__(self) -> str:
+        return f"[L2Recorder] [{self.exchange}:{self.ccy_1}/{self.ccy_2}]"
+
+
+def reconstruct_order_book(exchange: str, ccy_1: str, ccy_2: str, at: datetime) -> Tuple[List[Tuple[float, float]], List[Tuple[float, float]]]:
+    """
+    Rebuilds the book of exchange/ccy_1/ccy_2 as it was at `at` (after every update with event time <= at).
+    Returns (bids, asks) as lists of (price, quantity), best levels first.
+    """
+    at_naive = at.astimezone(pytz.UTC).replace(tzinfo=None) if at.tzinfo else at
+    snapshot = db_helper.fetch_all(
+        """
+        SELECT timestamp, depth, price_decimals, qty_decimals, payload FROM l2_snapshots
+        WHERE exchange = %s AND currency_1 = %s AND currency_2 = %s AND timestamp <= %s
+        ORDER BY timestamp DESC LIMIT 1
+        """,
+        (exchange, ccy_1, ccy_2, at_naive),
+    )
+    if not snapshot:
+        raise LookupError(f"No L2 snapshot for {exchange}:{ccy_1}/{ccy_2} before {at}")
+    snapshot_time, depth, price_decimals, qty_decimals, payload = snapshot[0]
+    price_scale, qty_scale = 10 ** price_decimals, 10 ** qty_decimals
+
+    # Integer ticks/units all the way, floats only on the way out
+    bids = SortedDict(lambda x: -x)
+    asks = SortedDict()
+    snapshot_bids, snapshot_asks = decode_snapshot(bytes(payload))
+    bids.update(snapshot_bids)
+    asks.update(snapshot_asks)
+
+    snapshot_us = to_us(snapshot_time.replace(tzinfo=pytz.UTC))
+    at_us = to_us(at_naive.replace(tzinfo=pytz.UTC))
+    blocks = db_helper.fetch_all(
+        """
+        SELECT payload FROM l2_deltas
+        WHERE exchange = %s AND currency_1 = %s AND currency_2 = %s AND end_time > %s AND start_time <= %s
+        ORDER BY start_time, id
+        """,
+        (exchange, ccy_1, ccy_2, snapshot_time, at_naive),
+    )
+    for (block_payload,) in blocks:
+        for timestamp_us, side, price, quantity in decode_deltas(bytes(block_payload)):
+            if timestamp_us <= snapshot_us:
+                continue
+            if timestamp_us > at_us:
+                break
+            apply_delta(bids, asks, side, price, quantity, depth)
+
+    return ([(price / price_scale, quantity / qty_scale) for price, quantity in bids.items()],
+            [(price / price_scale, quantity / qty_scale) for price, quantity in asks.items()])
+
+
+def apply_delta(bids: SortedDict, asks: SortedDict, side: int, price: int, quantity: int, depth: int) -> None:
+    # Same logic as FullOrderBook.register_tick, so that replaying deltas gives the exact same book
+    if side == CLEAR:
+        bids.clear()
+        asks.clear()
+        return
+    levels = bids if side == BID else asks
+    if quantity > 0:
+        levels[price] = quantity
+    elif price in levels:
+        del levels[price]
+    while len(levels) > depth:
+        levels.popitem()
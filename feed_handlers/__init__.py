@@ -1,5 +1,6 @@
 from .feed_handler import FeedHandler
 from .coinbase_feed_handler import CoinbaseFeedHandler
 from .kraken_feed_handler import KrakenFeedHandler
+from .feed_handler_manager import FeedHandlerManager
 
-__all__ = ["FeedHandler", "CoinbaseFeedHandler", "KrakenFeedHandler"]
+__all__ = ["FeedHandler", "CoinbaseFeedHandler", "KrakenFeedHandler", "FeedHandlerManager"]
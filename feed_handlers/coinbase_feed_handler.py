@@ -3,6 +3,7 @@ from config import config, secrets
 from market import FullOrderBook
 from logger import get_logger
 import traceback
+import logging
 import json
 import time
 import websocket
@@ -39,13 +40,19 @@ class CoinbaseFeedHandler(FeedHandler):
         self.retry_count = 0
 
     def on_message(self, ws, message):
+        received = time.time()
+        metrics = self.order_book.metrics
         data = json.loads(message)
-        logger.debug(f"Received data on channel: {data['channel']}")
+        metrics.parse_time.observe(time.time() - received)
+        metrics.messages.inc()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Received data on channel: %s", data['channel'])
         if data.get("channel") == "l2_data":
             for event in data["events"]:
                 if event["type"] in ["update", "snapshot"]:
                     if event["type"] == "snapshot":
                         logger.debug("Starting snapshot processing")
+                        self.order_book.begin_snapshot()
                     for update in event["updates"]:
                         if update["side"] == "bid":
                             self.order_book.set_bid(bid=float(update["price_level"]), bid_q=float(update["new_quantity"]), event_time=isoparse(update["event_time"]))
@@ -53,9 +60,12 @@ class CoinbaseFeedHandler(FeedHandler):
                             self.order_book.set_ask(ask=float(update["price_level"]), ask_q=float(update["new_quantity"]), event_time=isoparse(update["event_time"]))
                     if event["type"] == "snapshot":
                         logger.debug("Snapshot processing complete")
-                        self.order_book.snapshot_complete  = True
+                        self.order_book.end_snapshot()
+            metrics.apply_time.observe(time.time() - received)
+            if self.order_book.last_update:
+                metrics.feed_latency.observe(received - self.order_book.last_update.timestamp())
         else:
-            logger.debug(f"Non l2_data message received: {data}")
+            logger.debug("Non l2_data message received: %s", data)
 
     def on_open(self, ws):
         # Subscribe to the desired channels
@@ -101,11 +111,6 @@ class CoinbaseFeedHandler(FeedHandler):
             logger.error("Max retries exceeded. Could not connect to WebSocket.")
             self.running = False
 
-    def stop_fh(self):
-        self.running = False
-        if self.ws:
-            self.ws.close()
-
     def sign_with_jwt(self, message, channel, products=[]):
         # Not implemented, not needed for now.
         return message
@@ -1,7 +1,7 @@
 import threading
 import websocket
 from abc import ABC, abstractmethod
-from crypto_arb_finder.market.order_book import OrderBook
+from market import OrderBook
 from logger import get_logger
 import time
 
@@ -21,6 +21,10 @@ class FeedHandler(ABC):
         self.socket_id = ""
         self.unknown_ws_types = set()
         self.reconnect_attempts = 3
+        self.ws = None
+        self.fh_ws_thread = None
+        # Set by stop_fh, ends the reconnection loop
+        self.stop_event = threading.Event()
 
     @abstractmethod
     def on_message(self, ws, message):
@@ -49,11 +53,16 @@ class FeedHandler(ABC):
         def run_fh_ws():
             logger.debug(f"Now {threading.active_count()} active threads")
             # Initialize the WebSocket
-            while True:
+            connections = 0
+            while not self.stop_event.is_set():
                 try:
-                    self.order_book.reset()
+                    if connections:
+                        self.order_book.metrics.reconnects.inc()
+                    connections += 1
+                    # Resets the book, unless it can keep serving it until the exchange's snapshot
+                    self.order_book.warm_start()
                     # websocket.enableTrace(True)
-                    ws = websocket.WebSocketApp(
+                    self.ws = websocket.WebSocketApp(
                         ws_url,
                         on_open=self.on_open,
                         on_message=self.on_message,
@@ -62,17 +71,33 @@ class FeedHandler(ABC):
                     )
                     # Run the WebSocket
                     logger.debug("starting ws.run_forever() now...")
-                    ws.run_forever()
+                    self.ws.run_forever()
                 except Exception as e:
                     logger.exception(f"Exception occurred: {e}")
-                    if ws:
-                        ws.close()
+                    if self.ws:
+                        self.ws.close()
+                if self.stop_event.is_set():
+                    break
                 logger.debug("Sleeping 5s before attempting a reconnection")
-                time.sleep(5)
+                self.stop_event.wait(5)
+            logger.info(f"FH WS thread stopped (FH: {self})")
 
-        fh_ws_thread = threading.Thread(target=run_fh_ws)
+        self.fh_ws_thread = threading.Thread(target=run_fh_ws)
         logger.debug(f"Starting FH WS thread now... (FH: {self})")
-        fh_ws_thread.start()
+        self.fh_ws_thread.start()
+
+    # Closes the connection, waits for the WS thread to end and persists what's left in the order book
+    def stop_fh(self, timeout: float = 10):
+        logger.info(f"Stopping FH: {self}")
+        self.stop_event.set()
+        if self.ws:
+            self.ws.close()
+        if self.fh_ws_thread:
+            self.fh_ws_thread.join(timeout)
+            if self.fh_ws_thread.is_alive():
+                # Its updates still reach the book but no longer the DB (the book's buffer is closed)
+                logger.warning(f"FH WS thread still running after {timeout}s (FH: {self})")
+        self.order_book.stop()
 
     # Dunder methods...
     def __str__(self):
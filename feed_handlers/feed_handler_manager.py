@@ -0,0 +1,120 @@
+import os
+import threading
+from typing import Callable, Dict, List, Tuple
+from config import config
+from database import db_helper
+from feed_handlers import FeedHandler
+from feed_handlers.coinbase_feed_handler import CoinbaseFeedHandler
+from feed_handlers.kraken_feed_handler import KrakenFeedHandler
+from logger import get_logger
+from market import OrderBook
+
+logger = get_logger(__name__)
+
+FEED_HANDLER_CLASSES = {'Coinbase': CoinbaseFeedHandler, 'Kraken': KrakenFeedHandler}
+
+DEFAULT_COINS = ['BTC', 'ETH', 'SOL', 'XRP', 'TON', 'ADA']
+DEFAULT_EXCHANGES = list(FEED_HANDLER_CLASSES.keys())
+
+
+class FeedHandlerManager:
+    """
+    Owns one feed handler (and its FullOrderBook) per exchange/coin of the universe defined in config.yaml, and keeps
+    them in line with the file while running: books added to the universe are started, removed ones are stopped
+    (their pending rows flushed), and every other book keeps running untouched.
+    """
+
+    def __init__(self):
+        self.feed_handlers: Dict[Tuple[str, str, str], FeedHandler] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    @staticmethod
+    def configured_universe() -> Tuple[List[str], List[str], str]:
+        coins = config.get("universe.coins", DEFAULT_COINS)
+        exchanges = config.get("universe.exchanges", DEFAULT_EXCHANGES)
+        unknown_exchanges = [exchange for exchange in exchanges if exchange not in FEED_HANDLER_CLASSES]
+        if unknown_exchanges:
+            logger.error(f"No feed handler for exchanges {unknown_exchanges}, ignoring them")
+        return coins, [exchange for exchange in exchanges if exchange in FEED_HANDLER_CLASSES], config.get("universe.currency_2", "USD")
+
+    def apply_universe(self) -> None:
+        coins, exchanges, ccy_2 = self.configured_universe()
+        wanted = {(exchange, coin, ccy_2) for coin in coins for exchange in exchanges}
+        with self._lock:
+            to_add = sorted(wanted - self.feed_handlers.keys())
+            to_remove = sorted(self.feed_handlers.keys() - wanted)
+            if not to_add and not to_remove:
+                return
+            logger.info(f"Universe change: adding {to_add}, removing {to_remove}")
+            if to_add:
+                self.register_universe(coins, exchanges)
+
+            removed = [self.feed_handlers.pop(key) for key in to_remove]
+
+            for exchange, coin, currency_2 in to_add:
+                feed_handler = FEED_HANDLER_CLASSES[exchange](coin, currency_2)
+                self.feed_handlers[(exchange, coin, currency_2)] = feed_handler
+                feed_handler.start_fh()
+        # Outside of the lock: stopping a book can take a while (WS thread join, final flush and checkpoint)
+        self.stop_feed_handlers(removed)
+
+    @staticmethod
+    def stop_feed_handlers(feed_handlers: List[FeedHandler]) -> None:
+        """Stops the feed handlers in parallel, returns once all of them are stopped."""
+
+        def stop_fh(feed_handler: FeedHandler) -> None:
+            try:
+                feed_handler.stop_fh()
+            except Exception as e:
+                logger.exception(f"Error while stopping {feed_handler}: {e}")
+
+        threads = [threading.Thread(target=stop_fh, args=(feed_handler,), name=f"stop {feed_handler}")
+                   for feed_handler in feed_handlers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    @staticmethod
+    def register_universe(coins: List[str], exchanges: List[str]) -> None:
+        db_helper.execute(
+            "INSERT INTO currencies (currency) SELECT unnest(%s) ON CONFLICT (currency) DO NOTHING;", (list(coins),)
+        )
+        db_helper.execute(
+            "INSERT INTO exchanges (exchange) SELECT unnest(%s) ON CONFLICT (exchange) DO NOTHING;", (list(exchanges),)
+        )
+
+    def order_books(self) -> Dict[Tuple[str, str, str], OrderBook]:
+        with self._lock:
+            return {key: feed_handler.order_book for key, feed_handler in self.feed_handlers.items()}
+
+    def run(self, on_started: Callable[[], None] = None) -> None:
+        """
+        Starts the configured universe, then watches config.yaml until stop() is called (blocking).
+        on_started is called once the books are started.
+        """
+        self.apply_universe()
+        if on_started:
+            on_started()
+        reload_interval = config.get("universe.reload_interval_s", 5)
+        last_modified = os.path.getmtime(config.config_file)
+        while not self._stop_event.wait(reload_interval):
+            try:
+                modified = os.path.getmtime(config.config_file)
+                if modified == last_modified:
+                    continue
+                last_modified = modified
+                logger.info(f"{config.config_file} changed, reloading")
+                config.reload()
+                self.apply_universe()
+            except Exception as e:
+                # A half written or invalid file mustn't take the running books down, try again on the next change
+                logger.exception(f"Error while reloading the universe: {e}")
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        with self._lock:
+            feed_handlers = list(self.feed_handlers.values())
+            self.feed_handlers.clear()
+        self.stop_feed_handlers(feed_handlers)
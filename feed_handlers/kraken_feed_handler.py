@@ -8,6 +8,7 @@ import websocket
 from datetime import datetime
 import pytz
 import time
+from dateutil.parser import isoparse
 
 
 logger = get_logger(__name__)
@@ -32,12 +33,21 @@ class KrakenFeedHandler(FeedHandler):
 
     def on_message(self, ws, message):
         try:
+            received = time.time()
+            metrics = self.order_book.metrics
             response = json.loads(message)
+            metrics.parse_time.observe(time.time() - received)
+            metrics.messages.inc()
             if response.get("channel") == "book":
                 is_snapshot = True if response.get("type") == "snapshot" else False
                 
                 if response.get("type") in ["update", "snapshot"]:
                     self.process_update(response, is_snapshot)
+                    metrics.apply_time.observe(time.time() - received)
+                    # Book updates (not snapshots) carry the exchange's timestamp
+                    exchange_timestamp = response["data"][-1].get("timestamp") if response.get("data") else None
+                    if exchange_timestamp:
+                        metrics.feed_latency.observe(received - isoparse(exchange_timestamp).timestamp())
 
 
         except Exception as e:
@@ -67,6 +77,7 @@ class KrakenFeedHandler(FeedHandler):
     def process_update(self, response: dict, is_snapshot: bool = False):
         if is_snapshot:
             logger.debug("Processing snapshot")
+            self.order_book.begin_snapshot()
         # Kraken unfortunately doesn't provide a timestamp with its snapshot
         timestamp = datetime.now(pytz.UTC)
         for row in response.get("data"):
@@ -75,5 +86,5 @@ class KrakenFeedHandler(FeedHandler):
             for ask in row['asks']:
                 self.order_book.set_ask(ask=float(ask["price"]), ask_q=float(ask["qty"]), event_time=timestamp)
         if is_snapshot:
-            self.order_book.snapshot_complete  = True
+            self.order_book.end_snapshot()
             logger.debug("Snapshot complete")
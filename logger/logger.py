@@ -1,11 +1,65 @@
 import logging
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import TimedRotatingFileHandler, QueueHandler, QueueListener
+import atexit
 import os
+import queue
+import threading
+import time
 from datetime import datetime
+from typing import Dict
 from crypto_arb_finder.config import config
 
 
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most `max_per_second` records per call site (file:line) for loggers matching one of the configured
+    prefixes (e.g. "market.order_book"). Suppressed records are counted and reported with the next record let through.
+    """
+
+    def __init__(self, rate_limits: Dict[str, float]):
+        super().__init__()
+        # Longest prefixes first so that "market.order_book" wins over "market"
+        self._rate_limits = sorted(rate_limits.items(), key=lambda item: -len(item[0]))
+        self._limit_per_logger: Dict[str, float] = {}
+        # call site -> [window start, records in window, suppressed]
+        self._call_sites: Dict[tuple, list] = {}
+        # filter() runs on every thread that logs (one per feed handler)
+        self._lock = threading.Lock()
+
+    def _limit(self, logger_name: str):
+        if logger_name not in self._limit_per_logger:
+            self._limit_per_logger[logger_name] = next(
+                (limit for prefix, limit in self._rate_limits if logger_name == prefix or logger_name.startswith(prefix + ".")), None
+            )
+        return self._limit_per_logger[logger_name]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        limit = self._limit(record.name)
+        if limit is None:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            call_site = self._call_sites.setdefault((record.pathname, record.lineno), [now, 0, 0])
+            if now - call_site[0] >= 1:
+                call_site[0], call_site[1] = now, 0
+            if call_site[1] >= limit:
+                call_site[2] += 1
+                return False
+            call_site[1] += 1
+            suppressed, call_site[2] = call_site[2], 0
+        if suppressed:
+            # Merge msg and args first: msg may be any object and hold %-placeholders of its own
+            record.msg = f"{record.getMessage()} [{suppressed} similar messages suppressed]"
+            record.args = None
+        return True
+
+
 def configure_logger():
+    root_logger = logging.getLogger()
+    # Both "logger" and "crypto_arb_finder.logger" get imported (backend vs web GUI), only configure once
+    if any(isinstance(handler, QueueHandler) for handler in root_logger.handlers):
+        return
+
     # Define the logging format
     log_format = "%(asctime)s.%(msecs)03d [%(levelname)s] - %(message)s - %(filename)s:%(lineno)d"
 
@@ -14,6 +68,7 @@ def configure_logger():
         f"{os.path.expanduser(config.logger.logs_path)}crypto_arb_finder-{os.getpid()}.log",
         when="H",  # Rotate logs every hour
         interval=1,  # The interval to rotate logs
+        delay=True,  # The file is only created with the first record
         # backupCount=24  # Number of backup files to keep
     )
     log_file_handler.setFormatter(logging.Formatter(log_format, datefmt="%Y-%m-%d %H:%M:%S"))
@@ -22,10 +77,19 @@ def configure_logger():
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(logging.Formatter(log_format, datefmt="%Y-%m-%d %H:%M:%S"))
 
-    logging.basicConfig(
-        level=logging.DEBUG,
-        handlers=[log_file_handler, console_handler],
-    )
+    # Feed handler threads only put records on a queue, file and console I/O happen on the listener's thread
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(config.get("logger.rate_limits", {})))
+    listener = QueueListener(log_queue, log_file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root_logger.setLevel(config.get("logger.level", "INFO"))
+    root_logger.addHandler(queue_handler)
+    # Per module levels, e.g. {"market.order_book": "WARNING"}
+    for logger_name, level in config.get("logger.levels", {}).items():
+        logging.getLogger(logger_name).setLevel(level)
 
 """    logging.basicConfig(
         level=logging.DEBUG,
@@ -1,46 +1,62 @@
+import time
+# Start up is timed from here, see the startup report logged once the books are started
+start_time = time.perf_counter()
+
 from dotenv import load_dotenv
 from logger import get_logger
-from feed_handlers import KrakenFeedHandler, CoinbaseFeedHandler
-from database import db_helper
+from feed_handlers import FeedHandlerManager
+from metrics import start_metrics_server, StartupReport
+from market import ArbEpisodeRecorder
+from config import config
 
 logger = get_logger(__name__)
 
 
 def main():
+    startup_report = StartupReport("backend", start_time)
+    startup_report.phase("imports")
     logger.info("Starting Crypto Arb Opportunities Finder")
 
-    coins = ['BTC', 'ETH', 'SOL', 'XRP', 'TON', 'ADA']
-    exchanges = {'Coinbase': CoinbaseFeedHandler, 'Kraken': KrakenFeedHandler}
-
-    init_coins_query = f"""
-        INSERT INTO currencies (currency)
-        VALUES
-            ('{"'), ('".join([c for c in coins])}')
-        ON CONFLICT (currency) DO NOTHING;
-    """
-
-    init_exchanges_query = f"""
-        INSERT INTO exchanges (exchange)
-        VALUES
-            ('{"'), ('".join([e for e in exchanges.keys()])}')
-        ON CONFLICT (exchange) DO NOTHING;
-    """
-
-    db_helper.execute(init_coins_query)
-    db_helper.execute(init_exchanges_query)
-
-    feed_handlers = []
-    for coin in coins:
-        for fh in exchanges.values():
-            feed_handlers.append(fh(coin, "USD"))
-            feed_handlers.append(fh(coin, "USD"))
+    if config.get("metrics.enabled", False):
+        start_metrics_server(config.get("metrics.host", "127.0.0.1"), config.get("metrics.port", 9108))
+        startup_report.phase("metrics server")
+
+    # Coins and exchanges come from the universe section of config.yaml, which is watched for changes
+    feed_handler_manager = FeedHandlerManager()
+
+    if config.get("api.enabled", False):
+        # Only loaded when enabled: pulls in websockets and asyncio
+        from api import start_api_server
+
+        start_api_server(
+            feed_handler_manager.order_books,
+            host=config.get("api.host", "127.0.0.1"),
+            port=config.get("api.port", 9110),
+            ws_port=config.get("api.ws_port", 9111),
+            history_minutes=config.get("api.history_minutes", 15),
+            history_max_rows=config.get("api.history_max_rows", 100_000),
+            push_interval_ms=config.get("api.push_interval_ms", 250),
+        )
+        startup_report.phase("api server")
+
+    arb_episode_recorder = None
+
+    def on_started():
+        nonlocal arb_episode_recorder
+        # Includes the DB connection (and schema check) made when registering the universe
+        startup_report.phase("books started")
+        startup_report.report()
+        if config.get("arb_episodes.enabled", False):
+            arb_episode_recorder = ArbEpisodeRecorder.from_config(feed_handler_manager.order_books).start()
+
     try:
-        for feed_handler in feed_handlers:
-            feed_handler.start_fh()
+        feed_handler_manager.run(on_started)
     except KeyboardInterrupt:
-        logger.info(f"KeyboardInterrupt: Stopping FH [{feed_handler}]")
-        feed_handler.stop_fh()
-        logger.info(f"Feed handler [{feed_handler}] stopped")
+        logger.info("KeyboardInterrupt: Stopping feed handlers")
+        feed_handler_manager.stop()
+        logger.info("Feed handlers stopped")
+        if arb_episode_recorder:
+            arb_episode_recorder.stop()
 
     # Start web GUI
     # start_web_gui()
@@ -1,3 +1,6 @@
 from .order_book import OrderBook, FullOrderBook, BestBidOfferOrderBook
+from .book_stats import BookStats
+from .arb_detector import ArbEpisode, ArbEpisodeDetector, ArbEpisodeRecorder, detect_episodes
 
-__all__ = ["OrderBook", "FullOrderBook", "BestBidOfferOrderBook"]
+__all__ = ["OrderBook", "FullOrderBook", "BestBidOfferOrderBook", "BookStats", "ArbEpisode", "ArbEpisodeDetector", "ArbEpisodeRecorder",
+           "detect_episodes"]
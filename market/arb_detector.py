@@ -0,0 +1,263 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import pytz
+from config import config
+from database import arb_episodes
+from logger import get_logger
+from metrics import registry
+
+logger = get_logger(__name__)
+
+# Arbitrage episodes.
+# For every pair of exchanges quoting the same instrument, selling on one (at its bid) and buying on the other (at its
+# ask) yields bid - ask - taking fees on both legs per unit. An episode is a continuous stretch of time during which
+# that is positive (and at least min_edge_bps of the mid): it starts with the quote that made it profitable and ends
+# with the one that made it unprofitable again (or when a quote goes stale). Only the peak is kept, with the tops of
+# book at the time, so episodes stay small however long they last.
+
+
+@dataclass
+class ArbEpisode:
+    currency_1: str
+    currency_2: str
+    sell_exchange: str
+    buy_exchange: str
+    start_time: datetime
+    peak_time: datetime
+    # Per unit of currency_1, net of fees, in currency_2
+    peak_profit: float
+    peak_edge_bps: float
+    peak_bid: float
+    peak_bid_q: float
+    peak_ask: float
+    peak_ask_q: float
+    end_time: Optional[datetime] = None
+    # Quotes seen during the episode
+    updates: int = 1
+
+    @property
+    def duration(self) -> timedelta:
+        return (self.end_time or self.peak_time) - self.start_time
+
+    @property
+    def peak_quantity(self) -> float:
+        """What could have been traded at the peak, on both tops of book."""
+        return min(self.peak_bid_q, self.peak_ask_q)
+
+
+# exchange -> (event_time, bid_q, bid, ask, ask_q)
+Quotes = Dict[str, Tuple[datetime, float, float, float, float]]
+
+
+class ArbEpisodeDetector:
+    """
+    Turns the quotes of several exchanges into ArbEpisodes, passed to on_episode once closed.
+    taking_fees are in % per exchange (as in the web GUI). Quotes older than max_quote_age_s (compared to the quote
+    being processed) don't count, and end the episodes they were part of.
+    Thread safe: quotes of different books can come from different threads.
+    """
+
+    def __init__(self, taking_fees: Dict[str, float], min_edge_bps: float = 0.0, max_quote_age_s: float = 5.0,
+                 on_episode: Callable[[ArbEpisode], None] = None):
+        self.taking_fees = {exchange: fee / 100 for exchange, fee in taking_fees.items()}
+        self.min_edge = min_edge_bps / 10_000
+        self.max_quote_age = timedelta(seconds=max_quote_age_s)
+        self.on_episode = on_episode
+        # (currency_1, currency_2) -> Quotes
+        self.quotes: Dict[Tuple[str, str], Quotes] = {}
+        # (currency_1, currency_2, sell_exchange, buy_exchange) -> open episode
+        self.open_episodes: Dict[Tuple[str, str, str, str], ArbEpisode] = {}
+        self._lock = Lock()
+
+    def on_quote(self, exchange: str, currency_1: str, currency_2: str, event_time: datetime,
+                 bid_q: float, bid: float, ask: float, ask_q: float) -> None:
+        closed = []
+        with self._lock:
+            quotes = self.quotes.setdefault((currency_1, currency_2), {})
+            quotes[exchange] = (event_time, bid_q, bid, ask, ask_q)
+            for other_exchange, other in list(quotes.items()):
+                if other_exchange == exchange:
+                    continue
+                if event_time - other[0] > self.max_quote_age:
+                    del quotes[other_exchange]
+                    closed.extend(self._close_book(currency_1, currency_2, other_exchange, other[0]))
+                    continue
+                # The updated book can be either the selling or the buying leg
+                self._update(currency_1, currency_2, exchange, bid_q, bid, other_exchange, other[4], other[3], event_time, closed)
+                self._update(currency_1, currency_2, other_exchange, other[1], other[2], exchange, ask_q, ask, event_time, closed)
+        self._emit(closed)
+
+    def _update(self, currency_1: str, currency_2: str, sell_exchange: str, bid_q: float, bid: float,
+                buy_exchange: str, ask_q: float, ask: float, event_time: datetime, closed: List[ArbEpisode]) -> None:
+        key = (currency_1, currency_2, sell_exchange, buy_exchange)
+        episode = self.open_episodes.get(key)
+        profit = edge = None
+        if bid is not None and ask is not None:
+            profit = bid - ask - bid * self.taking_fees.get(sell_exchange, 0.0) - ask * self.taking_fees.get(buy_exchange, 0.0)
+            edge = profit / ((bid + ask) / 2)
+        if profit is None or profit <= 0 or edge < self.min_edge:
+            if episode is not None:
+                episode.end_time = event_time
+                closed.append(self.open_episodes.pop(key))
+            return
+        edge_bps = edge * 10_000
+        if episode is None:
+            self.open_episodes[key] = ArbEpisode(currency_1, currency_2, sell_exchange, buy_exchange, event_time, event_time,
+                                                 profit, edge_bps, bid, bid_q, ask, ask_q)
+            return
+        episode.updates += 1
+        if edge_bps > episode.peak_edge_bps:
+            episode.peak_time, episode.peak_profit, episode.peak_edge_bps = event_time, profit, edge_bps
+            episode.peak_bid, episode.peak_bid_q, episode.peak_ask, episode.peak_ask_q = bid, bid_q, ask, ask_q
+
+    def _close_book(self, currency_1: str, currency_2: str, exchange: str, end_time: datetime) -> List[ArbEpisode]:
+        # Episodes can't last longer than the quotes they are based on
+        closed = []
+        for key in [key for key in self.open_episodes if key[:2] == (currency_1, currency_2) and exchange in key[2:]]:
+            episode = self.open_episodes.pop(key)
+            episode.end_time = max(end_time, episode.peak_time)
+            closed.append(episode)
+        return closed
+
+    def remove_book(self, exchange: str, currency_1: str, currency_2: str) -> None:
+        """Forgets a book (e.g. removed from the universe), ending its open episodes at its last quote."""
+        with self._lock:
+            quote = self.quotes.get((currency_1, currency_2), {}).pop(exchange, None)
+            closed = self._close_book(currency_1, currency_2, exchange, quote[0]) if quote else []
+        self._emit(closed)
+
+    def expire(self, now: datetime) -> None:
+        """Drops the quotes older than max_quote_age at now, for books that went quiet (no quote to compare them to)."""
+        closed = []
+        with self._lock:
+            for (currency_1, currency_2), quotes in self.quotes.items():
+                for exchange, quote in list(quotes.items()):
+                    if now - quote[0] > self.max_quote_age:
+                        del quotes[exchange]
+                        closed.extend(self._close_book(currency_1, currency_2, exchange, quote[0]))
+        self._emit(closed)
+
+    def close_all(self) -> None:
+        """Ends every open episode at its last update (end of the data, shutdown)."""
+        with self._lock:
+            closed = []
+            for (currency_1, currency_2, sell_exchange, buy_exchange), episode in self.open_episodes.items():
+                quotes = self.quotes.get((currency_1, currency_2), {})
+                last_times = [quotes[exchange][0] for exchange in (sell_exchange, buy_exchange) if exchange in quotes]
+                episode.end_time = max(last_times + [episode.peak_time])
+                closed.append(episode)
+            self.open_episodes.clear()
+        self._emit(closed)
+
+    def _emit(self, closed: List[ArbEpisode]) -> None:
+        # Outside of the lock, on_episode may take its time
+        if self.on_episode:
+            for episode in closed:
+                self.on_episode(episode)
+
+
+def detect_episodes(events: Iterable, taking_fees: Dict[str, float], min_edge_bps: float = 0.0,
+                    max_quote_age_s: float = 5.0) -> Iterator[ArbEpisode]:
+    """
+    Batch version: yields the episodes of a time ordered stream of quote events (e.g. backtest.merged_events), as
+    they close. Episodes still open at the end of the stream end with it.
+    """
+    closed: List[ArbEpisode] = []
+    detector = ArbEpisodeDetector(taking_fees, min_edge_bps, max_quote_age_s, on_episode=closed.append)
+    for event in events:
+        detector.on_quote(event.exchange, event.currency_1, event.currency_2, event.timestamp,
+                          event.bid_q, event.bid, event.ask, event.ask_q)
+        if closed:
+            yield from closed
+            closed.clear()
+    detector.close_all()
+    yield from closed
+
+
+class ArbEpisodeRecorder:
+    """
+    Live detection: follows the books of books_provider (e.g. FeedHandlerManager.order_books), registered as one of
+    their bbo_listeners, and stores the episodes every flush_interval_s on its own thread.
+    """
+
+    def __init__(self, books_provider: Callable[[], dict], taking_fees: Dict[str, float], min_edge_bps: float = 0.0,
+                 max_quote_age_s: float = 5.0, flush_interval_s: float = 10.0):
+        self.books_provider = books_provider
+        self.detector = ArbEpisodeDetector(taking_fees, min_edge_bps, max_quote_age_s, on_episode=self._on_episode)
+        self.flush_interval = flush_interval_s
+        # (exchange, currency_1, currency_2) -> (order_book, listener)
+        self._listeners: Dict[Tuple[str, str, str], tuple] = {}
+        self._episodes: List[ArbEpisode] = []
+        self._episodes_lock = Lock()
+        self._stop_event = Event()
+        self._thread: Optional[Thread] = None
+
+    @classmethod
+    def from_config(cls, books_provider: Callable[[], dict]) -> "ArbEpisodeRecorder":
+        return cls(
+            books_provider,
+            taking_fees=config.get("arb_episodes.taking_fees", {}),
+            min_edge_bps=config.get("arb_episodes.min_edge_bps", 0.0),
+            max_quote_age_s=config.get("arb_episodes.max_quote_age_s", 5.0),
+            flush_interval_s=config.get("arb_episodes.flush_interval_s", 10.0),
+        )
+
+    def _on_episode(self, episode: ArbEpisode) -> None:
+        registry.counter("arb_finder_arb_episodes_total", "Arbitrage episodes detected live", currency_1=episode.currency_1,
+                         sell_exchange=episode.sell_exchange, buy_exchange=episode.buy_exchange).inc()
+        with self._episodes_lock:
+            self._episodes.append(episode)
+
+    def _listener(self, exchange: str, currency_1: str, currency_2: str):
+        on_quote = self.detector.on_quote
+
+        def listener(order_book, event_time: datetime, bid_q: float, bid: float, ask: float, ask_q: float) -> None:
+            on_quote(exchange, currency_1, currency_2, event_time, bid_q, bid, ask, ask_q)
+
+        return listener
+
+    def sync_books(self, order_books: dict) -> None:
+        """Follows the books added to/removed from the universe."""
+        for key, order_book in order_books.items():
+            registered = self._listeners.get(key)
+            if registered is None or registered[0] is not order_book:
+                listener = self._listener(*key)
+                order_book.add_bbo_listener(listener)
+                self._listeners[key] = (order_book, listener)
+        for key in self._listeners.keys() - order_books.keys():
+            order_book, listener = self._listeners.pop(key)
+            order_book.remove_bbo_listener(listener)
+            self.detector.remove_book(*key)
+
+    def flush(self) -> None:
+        with self._episodes_lock:
+            episodes, self._episodes = self._episodes, []
+        if episodes:
+            arb_episodes.store_episodes(episodes, arb_episodes.LIVE)
+            logger.info(f"{len(episodes)} arb episodes stored")
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self.sync_books(self.books_provider())
+                self.detector.expire(datetime.now(pytz.UTC))
+                self.flush()
+            except Exception as e:
+                logger.exception(f"Error while recording arb episodes: {e}")
+
+    def start(self) -> "ArbEpisodeRecorder":
+        self.sync_books(self.books_provider())
+        self._thread = Thread(target=self.run, name="arb_episode_recorder")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Ends the open episodes and stores whatever is left."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+        self.detector.close_all()
+        self.flush()
@@ -0,0 +1,185 @@
+from datetime import datetime
+from math import exp, log, nan, sqrt
+from typing import List, Optional, Sequence, Tuple
+import pytz
+from config import config
+from logger import get_logger
+from metrics import registry
+
+logger = get_logger(__name__)
+
+# Top of book statistics of one order book, updated in O(1) on every BBO change:
+# - rolling, over each of the configured windows (exponentially decaying with a time constant of window seconds):
+#   spread (bps of the mid) and top of book imbalance as time weighted EWMAs, mid volatility (bps) from the decayed
+#   sum of squared log returns of the mid, update rate from the decayed count of BBO changes
+# - per minute: Welford aggregates (mean, std, min, max) of the spread and imbalance, realised volatility of the mid,
+#   number of updates and mean sizes, emitted as one MinuteStats row (book_stats_1m table) when the minute is over
+
+MINUTE_COLUMNS = ["minute", "updates", "spread_bps_mean", "spread_bps_std", "spread_bps_min", "spread_bps_max",
+                  "mid_open", "mid_close", "mid_volatility_bps", "imbalance_mean", "imbalance_std", "bid_q_mean", "ask_q_mean"]
+
+
+class Welford:
+    """Running mean/variance/min/max (Welford's algorithm)."""
+    __slots__ = ("count", "mean", "_m2", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = nan
+        self.max = nan
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        if self.count == 1:
+            self.min = self.max = value
+        elif value < self.min:
+            self.min = value
+        elif value > self.max:
+            self.max = value
+
+    @property
+    def std(self) -> float:
+        return sqrt(self._m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+
+class RollingWindow:
+    """Exponentially decaying statistics over window_s seconds, for updates at irregular times."""
+    __slots__ = ("window_s", "spread_bps", "imbalance", "_squared_returns", "_updates", "_last_time")
+
+    def __init__(self, window_s: float):
+        self.window_s = window_s
+        self.spread_bps = nan
+        self.imbalance = nan
+        self._squared_returns = 0.0
+        self._updates = 0.0
+        self._last_time = None
+
+    def update(self, event_time: float, spread_bps: float, imbalance: float, squared_return: float,
+               previous_spread_bps: float, previous_imbalance: float) -> None:
+        if self._last_time is None:
+            self.spread_bps, self.imbalance = spread_bps, imbalance
+            self._updates = 1.0
+            self._last_time = event_time
+            return
+        decay = exp(-max(event_time - self._last_time, 0.0) / self.window_s)
+        # Time weighted: the previous values held since the last update
+        self.spread_bps = previous_spread_bps + decay * (self.spread_bps - previous_spread_bps)
+        self.imbalance = previous_imbalance + decay * (self.imbalance - previous_imbalance)
+        self._squared_returns = self._squared_returns * decay + squared_return
+        self._updates = self._updates * decay + 1.0
+        self._last_time = event_time
+
+    @property
+    def volatility_bps(self) -> float:
+        return sqrt(self._squared_returns) * 10_000
+
+    @property
+    def update_rate(self) -> float:
+        """BBO changes per second."""
+        return self._updates / self.window_s
+
+
+class MinuteStats:
+    __slots__ = ("minute", "spread_bps", "imbalance", "mid_open", "mid_close", "_squared_returns", "_bid_q", "_ask_q")
+
+    def __init__(self, minute: int, mid: float):
+        self.minute = minute
+        self.spread_bps = Welford()
+        self.imbalance = Welford()
+        self.mid_open = self.mid_close = mid
+        self._squared_returns = 0.0
+        self._bid_q = 0.0
+        self._ask_q = 0.0
+
+    def add(self, spread_bps: float, imbalance: float, mid: float, squared_return: float, bid_q: float, ask_q: float) -> None:
+        self.spread_bps.add(spread_bps)
+        self.imbalance.add(imbalance)
+        self.mid_close = mid
+        self._squared_returns += squared_return
+        self._bid_q += bid_q
+        self._ask_q += ask_q
+
+    def row(self) -> tuple:
+        """Values of MINUTE_COLUMNS."""
+        updates = self.spread_bps.count
+        return (datetime.fromtimestamp(self.minute * 60, pytz.UTC).replace(tzinfo=None), updates,
+                self.spread_bps.mean, self.spread_bps.std, self.spread_bps.min, self.spread_bps.max,
+                self.mid_open, self.mid_close, sqrt(self._squared_returns) * 10_000,
+                self.imbalance.mean, self.imbalance.std, self._bid_q / updates, self._ask_q / updates)
+
+
+class BookStats:
+    """
+    Statistics of one order book, fed by update() on every BBO change (feed handler thread). Finished minutes are
+    kept until taken by pop_minutes() (DB thread).
+    """
+
+    def __init__(self, exchange: str, ccy_1: str, ccy_2: str, windows_s: Sequence[float] = (10, 60, 300)):
+        self.windows = [RollingWindow(window_s) for window_s in windows_s]
+        self._minute: Optional[MinuteStats] = None
+        self._finished: List[MinuteStats] = []
+        self._mid = None
+        self._spread_bps = nan
+        self._imbalance = nan
+        labels = {"exchange": exchange, "instrument": f"{ccy_1}/{ccy_2}"}
+        # Set once a minute, enough for alerting and free on the hot path
+        self._gauges = [tuple(registry.gauge(name, help, window=f"{window.window_s:g}s", **labels) for name, help in (
+            ("arb_finder_spread_bps", "Time weighted spread (bps of the mid), EWMA over the window"),
+            ("arb_finder_mid_volatility_bps", "Volatility of the mid (bps) over the window"),
+            ("arb_finder_bbo_update_rate", "BBO changes per second over the window"),
+            ("arb_finder_imbalance", "Time weighted top of book imbalance (bid_q - ask_q) / (bid_q + ask_q), EWMA over the window"),
+        )) for window in self.windows]
+
+    @classmethod
+    def from_config(cls, exchange: str, ccy_1: str, ccy_2: str) -> Optional["BookStats"]:
+        if not config.get("order_book.stats.enabled", True):
+            return None
+        return cls(exchange, ccy_1, ccy_2, config.get("order_book.stats.windows_s", [10, 60, 300]))
+
+    def reset(self) -> None:
+        # Levels were cleared (e.g. reconnect): the next mid isn't a return from the last one
+        self._mid = None
+
+    def update(self, event_time: float, bid_q: float, bid: float, ask: float, ask_q: float) -> None:
+        if bid is None or ask is None or not bid_q or not ask_q:
+            # One sided book (e.g. during a reset): nothing meaningful to add
+            return
+        mid = (bid + ask) / 2
+        spread_bps = (ask - bid) / mid * 10_000
+        imbalance = (bid_q - ask_q) / (bid_q + ask_q)
+        squared_return = log(mid / self._mid) ** 2 if self._mid else 0.0
+        for window in self.windows:
+            window.update(event_time, spread_bps, imbalance, squared_return, self._spread_bps, self._imbalance)
+        self._mid, self._spread_bps, self._imbalance = mid, spread_bps, imbalance
+
+        minute = int(event_time // 60)
+        current = self._minute
+        if current is None or minute > current.minute:
+            if current is not None:
+                self._finish(current)
+            current = self._minute = MinuteStats(minute, mid)
+        current.add(spread_bps, imbalance, mid, squared_return, bid_q, ask_q)
+
+    def _finish(self, minute: MinuteStats) -> None:
+        self._finished.append(minute)
+        for window, gauges in zip(self.windows, self._gauges):
+            for gauge, value in zip(gauges, (window.spread_bps, window.volatility_bps, window.update_rate, window.imbalance)):
+                gauge.set(value)
+
+    def pop_minutes(self, include_current: bool = False) -> List[tuple]:
+        """Rows (MINUTE_COLUMNS) of the finished minutes, and of the current one if include_current (shutdown)."""
+        if include_current and self._minute is not None:
+            self._finish(self._minute)
+            self._minute = None
+        finished, self._finished = self._finished, []
+        return [minute.row() for minute in finished]
+
+    def snapshot(self) -> List[Tuple[float, float, float, float, float]]:
+        """(window_s, spread_bps, volatility_bps, update_rate, imbalance) per window, as of the last update."""
+        return [(window.window_s, window.spread_bps, window.volatility_bps, window.update_rate, window.imbalance)
+                for window in self.windows]
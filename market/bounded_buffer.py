@@ -0,0 +1,247 @@
+from array import array
+from threading import Condition, Lock
+from typing import Optional
+import math
+import time
+from config import config
+from logger import get_logger
+from metrics import BookMetrics, registry
+
+logger = get_logger(__name__)
+
+# Overflow policies
+BLOCK, CONFLATE, DROP_OLDEST = "block", "conflate", "drop_oldest"
+OVERFLOW_POLICIES = (BLOCK, CONFLATE, DROP_OLDEST)
+
+CHUNK_SIZE = 4096
+_ZEROS = array("d", bytes(8 * CHUNK_SIZE))
+NAN = math.nan
+
+
+class BboColumns:
+    """
+    BBO rows of one book, stored column by column in preallocated double arrays grown CHUNK_SIZE rows at a time:
+    appending a row doesn't allocate anything (no dict, no tuple, no boxed float kept alive).
+    Times are in seconds since epoch, missing prices/sizes (empty side) are stored as NaN.
+    Live rows are [start, end): dropping the oldest row only moves start, the arrays are compacted when they'd grow.
+    """
+
+    __slots__ = ("time", "bid_q", "bid", "ask", "ask_q", "start", "end", "allocated")
+
+    def __init__(self):
+        self.time = array("d", _ZEROS)
+        self.bid_q = array("d", _ZEROS)
+        self.bid = array("d", _ZEROS)
+        self.ask = array("d", _ZEROS)
+        self.ask_q = array("d", _ZEROS)
+        self.start = 0
+        self.end = 0
+        self.allocated = CHUNK_SIZE
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    @property
+    def columns(self):
+        return self.time, self.bid_q, self.bid, self.ask, self.ask_q
+
+    def append(self, event_time: float, bid_q: float, bid: float, ask: float, ask_q: float) -> None:
+        if self.end == self.allocated:
+            self._grow()
+        self._set(self.end, event_time, bid_q, bid, ask, ask_q)
+        self.end += 1
+
+    def replace_last(self, event_time: float, bid_q: float, bid: float, ask: float, ask_q: float) -> None:
+        self._set(self.end - 1, event_time, bid_q, bid, ask, ask_q)
+
+    def drop_oldest(self) -> None:
+        self.start += 1
+
+    def _set(self, i: int, event_time: float, bid_q: float, bid: float, ask: float, ask_q: float) -> None:
+        self.time[i] = event_time
+        try:
+            self.bid_q[i] = bid_q
+            self.bid[i] = bid
+            self.ask[i] = ask
+            self.ask_q[i] = ask_q
+        except TypeError:
+            # None: one side of the book is empty
+            self.bid_q[i] = NAN if bid_q is None else bid_q
+            self.bid[i] = NAN if bid is None else bid
+            self.ask[i] = NAN if ask is None else ask
+            self.ask_q[i] = NAN if ask_q is None else ask_q
+
+    def _grow(self) -> None:
+        if self.start >= CHUNK_SIZE:
+            # At least a chunk of dropped rows at the front: reuse the room rather than growing
+            n = len(self)
+            for column in self.columns:
+                column[0:n] = column[self.start:self.end]
+            self.start, self.end = 0, n
+        else:
+            for column in self.columns:
+                column.extend(_ZEROS)
+            self.allocated += CHUNK_SIZE
+
+    def column_lists(self):
+        """The live rows' columns (time, bid_q, bid, ask, ask_q) as lists, read in place (no intermediate array)."""
+        return tuple(memoryview(column)[self.start:self.end].tolist() for column in self.columns)
+
+    def clear(self) -> None:
+        # Keeps the arrays, for reuse
+        self.start = self.end = 0
+
+
+class BufferBudget:
+    """Number of rows all the books together may hold in memory until they are persisted."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.used = 0
+        self._lock = Lock()
+        self._used_gauge = registry.gauge("arb_finder_buffered_rows_global", "Rows held in memory across all books, waiting to be persisted")
+        registry.gauge("arb_finder_buffer_capacity_global", "Max rows held in memory across all books").set(capacity)
+
+    def try_acquire(self, rows: int = 1) -> bool:
+        with self._lock:
+            if self.used + rows > self.capacity:
+                return False
+            self.used += rows
+            self._used_gauge.set(self.used)
+            return True
+
+    def acquire(self, rows: int = 1) -> None:
+        # Unconditional, for the rows a policy keeps above capacity
+        with self._lock:
+            self.used += rows
+            self._used_gauge.set(self.used)
+
+    def release(self, rows: int) -> None:
+        with self._lock:
+            self.used -= rows
+            self._used_gauge.set(self.used)
+
+
+_global_budget: Optional[BufferBudget] = None
+_global_budget_lock = Lock()
+
+
+def global_budget() -> BufferBudget:
+    global _global_budget
+    with _global_budget_lock:
+        if _global_budget is None:
+            _global_budget = BufferBudget(config.get("order_book.buffers.global_capacity", 2_000_000))
+        return _global_budget
+
+
+class BoundedBuffer:
+    """
+    BBO rows of one order book waiting to be persisted, bounded per book (capacity) and across books (global budget).
+    Rows are held from append() until release(), i.e. while in the buffer *and* while handed over to the DB thread.
+    When full, the overflow policy decides:
+     - block: the appending (feed handler) thread waits for the DB thread to release rows
+     - conflate: the newest buffered row is replaced by the new one, so the latest BBO is always kept
+     - drop_oldest: the oldest buffered row is dropped to make room
+    conflate and drop_oldest may hold one row above capacity when every held row is already with the DB thread
+    (or the global budget is used up by other books), so the latest BBO is never lost.
+    Rows are handed over by swapping BboColumns (drain), which come back once persisted (release) to be reused.
+    """
+
+    def __init__(self, capacity: int, policy: str, metrics: BookMetrics, budget: BufferBudget = None):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {policy}, expected one of {OVERFLOW_POLICIES}")
+        self.capacity = capacity
+        self.policy = policy
+        self.metrics = metrics
+        self.budget = budget or global_budget()
+        self._rows = BboColumns()
+        # Released BboColumns, ready for the next swap
+        self._spares = []
+        self._held = 0
+        self._closed = False
+        self._not_full = Condition()
+        metrics.buffer_capacity.set(capacity)
+
+    @classmethod
+    def from_config(cls, ccy_1: str, ccy_2: str, metrics: BookMetrics) -> "BoundedBuffer":
+        capacities = config.get("order_book.buffers.instruments", {})
+        default_capacity = config.get("order_book.buffers.capacity_per_book", 200_000)
+        capacity = capacities.get(f"{ccy_1}/{ccy_2}", capacities.get(ccy_1, default_capacity))
+        return cls(capacity, config.get("order_book.buffers.overflow_policy", CONFLATE), metrics)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _try_reserve(self) -> bool:
+        if self._held >= self.capacity or not self.budget.try_acquire():
+            return False
+        self._held += 1
+        return True
+
+    def append(self, event_time: float, bid_q: float, bid: float, ask: float, ask_q: float) -> None:
+        with self._not_full:
+            if self._closed:
+                # The book is stopped: nothing would ever release the row
+                self.metrics.buffer_dropped.inc()
+                return
+            rows = self._rows
+            if self._try_reserve():
+                rows.append(event_time, bid_q, bid, ask, ask_q)
+            elif self.policy == CONFLATE:
+                if len(rows):
+                    rows.replace_last(event_time, bid_q, bid, ask, ask_q)
+                    self.metrics.buffer_conflated.inc()
+                else:
+                    # Everything held is with the DB thread: keep the latest row anyway (capacity + 1)
+                    self._held += 1
+                    self.budget.acquire()
+                    rows.append(event_time, bid_q, bid, ask, ask_q)
+            elif self.policy == DROP_OLDEST:
+                if len(rows):
+                    rows.drop_oldest()
+                    self.metrics.buffer_dropped.inc()
+                else:
+                    # Nothing older to drop, everything held is with the DB thread: keep the row anyway (capacity + 1)
+                    self._held += 1
+                    self.budget.acquire()
+                rows.append(event_time, bid_q, bid, ask, ask_q)
+            else:
+                self.metrics.buffer_blocked.inc()
+                t0 = time.perf_counter()
+                while not self._try_reserve():
+                    if self._closed:
+                        self.metrics.buffer_dropped.inc()
+                        return
+                    # Woken up by release(), the timeout covers room freed by other books in the global budget
+                    self._not_full.wait(0.1)
+                self.metrics.buffer_block_time.observe(time.perf_counter() - t0)
+                # The buffer may have been swapped while waiting
+                self._rows.append(event_time, bid_q, bid, ask, ask_q)
+            self.metrics.buffered_rows.set(self._held)
+
+    def drain(self) -> BboColumns:
+        """Hands every buffered row over by swapping buffers (rows are still held until release)."""
+        with self._not_full:
+            rows = self._rows
+            self._rows = self._spares.pop() if self._spares else BboColumns()
+        return rows
+
+    def release(self, rows: BboColumns) -> None:
+        """Called with what drain() returned once persisted (or given up on)."""
+        with self._not_full:
+            self._held -= len(rows)
+            self.budget.release(len(rows))
+            self.metrics.buffered_rows.set(self._held)
+            rows.clear()
+            if len(self._spares) < 2:
+                self._spares.append(rows)
+            self._not_full.notify_all()
+
+    def clear(self) -> None:
+        self.release(self.drain())
+
+    def close(self) -> None:
+        # Unblocks appends waiting for room and refuses later ones, e.g. when the order book is stopped
+        with self._not_full:
+            self._closed = True
+            self._not_full.notify_all()
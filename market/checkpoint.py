@@ -0,0 +1,96 @@
+from array import array
+from datetime import datetime
+from typing import List, Optional, Tuple
+import os
+import struct
+import sys
+import time
+import zlib
+import pytz
+from config import config
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Order book checkpoints: one small binary file per book, rewritten every interval_s and when the book stops, so that
+# a restarted process can serve its books straight away (see FullOrderBook.warm_start) instead of waiting for every
+# exchange snapshot. Layout: header, then (price, quantity) float64 pairs (bids best first, then asks best first),
+# then the CRC32 of everything before it. Little endian throughout.
+
+CHECKPOINT_HEADER = struct.Struct("<4sHdII")  # magic, format version, last update (s since epoch), bid levels, ask levels
+CHECKPOINT_CRC = struct.Struct("<I")
+MAGIC, FORMAT_VERSION = b"OBCP", 1
+
+Levels = List[Tuple[float, float]]
+
+
+def encode_checkpoint(last_update: datetime, bids: Levels, asks: Levels) -> bytes:
+    levels = array("d", [value for level in bids + asks for value in level])
+    if sys.byteorder == "big":
+        levels.byteswap()
+    payload = CHECKPOINT_HEADER.pack(MAGIC, FORMAT_VERSION, last_update.timestamp(), len(bids), len(asks)) + levels.tobytes()
+    return payload + CHECKPOINT_CRC.pack(zlib.crc32(payload))
+
+
+def decode_checkpoint(data: bytes) -> Tuple[datetime, Levels, Levels]:
+    payload, (crc,) = data[:-CHECKPOINT_CRC.size], CHECKPOINT_CRC.unpack_from(data, len(data) - CHECKPOINT_CRC.size)
+    if zlib.crc32(payload) != crc:
+        raise ValueError("Checkpoint CRC mismatch")
+    magic, version, last_update, n_bids, n_asks = CHECKPOINT_HEADER.unpack_from(payload)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError(f"Unknown checkpoint format {magic!r} v{version}")
+    levels = array("d", payload[CHECKPOINT_HEADER.size:])
+    if sys.byteorder == "big":
+        levels.byteswap()
+    if len(levels) != 2 * (n_bids + n_asks):
+        raise ValueError(f"Checkpoint holds {len(levels)} values, {2 * (n_bids + n_asks)} expected")
+    pairs = list(zip(levels[::2], levels[1::2]))
+    return datetime.fromtimestamp(last_update, pytz.UTC), pairs[:n_bids], pairs[n_bids:]
+
+
+class BookCheckpoints:
+    """Checkpoint file of one order book."""
+
+    def __init__(self, exchange: str, ccy_1: str, ccy_2: str, path: str, interval_s: float = 10, max_age_s: float = 120):
+        self.file_path = os.path.join(os.path.expanduser(path), f"{exchange}_{ccy_1}_{ccy_2}.ckpt")
+        self.interval = interval_s
+        self.max_age = max_age_s
+        self._next_save = time.monotonic() + interval_s
+
+    @classmethod
+    def from_config(cls, exchange: str, ccy_1: str, ccy_2: str) -> Optional["BookCheckpoints"]:
+        if not config.get("order_book.checkpoints.enabled", False):
+            return None
+        return cls(exchange, ccy_1, ccy_2, config.get("order_book.checkpoints.path", "~/crypto_arb_finder/checkpoints/"),
+                   config.get("order_book.checkpoints.interval_s", 10), config.get("order_book.checkpoints.max_age_s", 120))
+
+    def due(self) -> bool:
+        return time.monotonic() >= self._next_save
+
+    def save(self, last_update: datetime, bids: Levels, asks: Levels) -> None:
+        self._next_save = time.monotonic() + self.interval
+        if not bids and not asks:
+            # Between a reset and the next snapshot: keep the previous checkpoint
+            return
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        temp_path = self.file_path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(encode_checkpoint(last_update, bids, asks))
+        # Readers only ever see a complete file
+        os.replace(temp_path, self.file_path)
+
+    def load(self) -> Optional[Tuple[datetime, Levels, Levels]]:
+        """(last update, bids, asks) of the checkpoint, None if there's none, it's unreadable or older than max_age_s."""
+        try:
+            with open(self.file_path, "rb") as file:
+                last_update, bids, asks = decode_checkpoint(file.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"Ignoring checkpoint {self.file_path}: {e}")
+            return None
+        age = (datetime.now(pytz.UTC) - last_update).total_seconds()
+        if age > self.max_age:
+            logger.info(f"Ignoring checkpoint {self.file_path}: {age:.0f}s old")
+            return None
+        return last_update, bids, asks
@@ -0,0 +1,118 @@
+from threading import Lock
+from typing import Optional
+from config import config
+
+
+class ConflationPolicy:
+    """
+    Decides which best bid/offer changes make it to the DB:
+     - min_interval_ms: saved rows are at least min_interval apart. A change at least min_interval after the last row
+       saved is saved straight away. The ones coming sooner replace each other, and only the last value is saved, as
+       of min_interval after the last row (it was still the current BBO then). It is held back until then (or until
+       the next flush)
+     - price_change_only: ignore changes where neither the bid nor the ask price moved (size flickers)
+     - min_size_change_pct: when prices didn't move, ignore size changes smaller than this (relative, in %)
+    The default (all zero/false) records every change.
+    """
+
+    def __init__(self, min_interval_ms: float = 0, price_change_only: bool = False, min_size_change_pct: float = 0):
+        self.min_interval = min_interval_ms / 1000
+        self.price_change_only = price_change_only
+        self.min_size_change = min_size_change_pct / 100
+
+    @property
+    def record_all(self) -> bool:
+        return not (self.min_interval or self.price_change_only or self.min_size_change)
+
+    @classmethod
+    def from_config(cls, ccy_1: str, ccy_2: str) -> "ConflationPolicy":
+        # Instrument settings ("BTC/USD" or "BTC") override the default ones
+        settings = dict(config.get("order_book.conflation.default", {}))
+        instruments = config.get("order_book.conflation.instruments", {})
+        settings.update(instruments.get(f"{ccy_1}/{ccy_2}", instruments.get(ccy_1, {})))
+        return cls(**settings)
+
+    def __str__(self) -> str:
+        if self.record_all:
+            return "[ConflationPolicy] record all"
+        return f"[ConflationPolicy] min_interval={self.min_interval * 1000:.0f}ms price_change_only={self.price_change_only} min_size_change={self.min_size_change * 100:.2f}%"
+
+
+class BboConflator:
+    """
+    Applies a ConflationPolicy to the BBO changes of one order book (time in seconds since epoch, bid_q, bid, ask,
+    ask_q), appending the rows to save to the given history.
+    """
+
+    def __init__(self, policy: ConflationPolicy, metrics):
+        self.policy = policy
+        self.metrics = metrics
+        self._lock = Lock()
+        # Last row accepted by the filters (saved or pending), used for the change thresholds
+        self._last_accepted: Optional[tuple] = None
+        # Earliest time of the next row saved (min_interval after the last one), and the last value held until then
+        self._next_save: Optional[float] = None
+        self._pending: Optional[tuple] = None
+
+    def offer(self, history, event_time: float, bid_q: float, bid: float, ask: float, ask_q: float) -> None:
+        if self.policy.record_all:
+            history.append(event_time, bid_q, bid, ask, ask_q)
+            self.metrics.bbo_rows_saved.inc()
+            return
+
+        with self._lock:
+            if not self._passes_thresholds(bid_q, bid, ask, ask_q):
+                self.metrics.bbo_rows_filtered.inc()
+                return
+            row = (event_time, bid_q, bid, ask, ask_q)
+            self._last_accepted = row
+
+            if not self.policy.min_interval:
+                self._save(row, history)
+                return
+
+            if self._pending is not None and event_time >= self._next_save:
+                if event_time > self._next_save:
+                    # The held value was still the current one at _next_save
+                    self._save_pending(history)
+                else:
+                    self._pending = None
+                    self.metrics.bbo_rows_conflated.inc()
+
+            if self._next_save is None or event_time >= self._next_save:
+                self._save(row, history)
+                return
+            if self._pending is not None:
+                self.metrics.bbo_rows_conflated.inc()
+            self._pending = row
+
+    def flush(self, now: float, history) -> None:
+        # Called periodically so that the held value gets saved on a quiet market too
+        with self._lock:
+            if self._pending is not None and now >= self._next_save:
+                self._save_pending(history)
+
+    def _passes_thresholds(self, bid_q: float, bid: float, ask: float, ask_q: float) -> bool:
+        last = self._last_accepted
+        if last is None or bid != last[2] or ask != last[3]:
+            return True
+        if self.policy.price_change_only:
+            return False
+        return self._size_changed(bid_q, last[1]) or self._size_changed(ask_q, last[4])
+
+    def _size_changed(self, size: Optional[float], last_size: Optional[float]) -> bool:
+        if size == last_size:
+            return False
+        if not last_size or size is None:
+            return True
+        return abs(size - last_size) / last_size >= self.policy.min_size_change
+
+    def _save_pending(self, history) -> None:
+        self._save((self._next_save,) + self._pending[1:], history)
+        self._pending = None
+
+    def _save(self, row: tuple, history) -> None:
+        history.append(*row)
+        self.metrics.bbo_rows_saved.inc()
+        if self.policy.min_interval:
+            self._next_save = row[0] + self.policy.min_interval
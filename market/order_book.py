@@ -1,7 +1,9 @@
 from logger import get_logger
+import logging
 from datetime import datetime
 import pytz
 from database import db_helper
+from database.l2_store import L2Recorder, BID, ASK
 import time
 import threading
 import queue
@@ -9,33 +11,125 @@ from typing import Literal
 import sqlite3
 from sortedcontainers import SortedDict
 from config import config
+from metrics import BookMetrics
+from market.conflation import ConflationPolicy, BboConflator
+from market.bounded_buffer import BboColumns, BoundedBuffer
+from market.book_stats import BookStats, MINUTE_COLUMNS
+from market.checkpoint import BookCheckpoints
 
 logger = get_logger(__name__)
 
+# Attempts at copying the levels of a FullOrderBook from another thread, 1ms apart
+COPY_LEVELS_ATTEMPTS = 100
+
 
 
 
 class OrderBook(threading.Thread):
-    def __init__(self, ccy_1: str, ccy_2: str, exchange: str) -> None:
+    # persist=False keeps the book in memory only (benchmarks, tools): no insertion/DB thread, no L2 recorder, no
+    # checkpoints, and nothing is written on stop
+    def __init__(self, ccy_1: str, ccy_2: str, exchange: str, persist: bool = True) -> None:
         super().__init__()
+        self.persist = persist
         self.depth = config.order_book.depth
         self._ccy_1 = ccy_1
         self._ccy_2 = ccy_2
         self._exchange = exchange
-        self._bid_ask_history = []
+        self.metrics = BookMetrics(exchange, ccy_1, ccy_2)
+        # Rows stay counted against the buffer's capacity from the BBO change until committed (or given up on)
+        self._bid_ask_history = BoundedBuffer.from_config(ccy_1, ccy_2, self.metrics)
         self.last_update = datetime.now(pytz.UTC)
+        # (enqueue time, BboColumns) batches
         self.db_queue = queue.Queue()
         self._max_db_inserts_attempts = 3
+        self.conflator = BboConflator(ConflationPolicy.from_config(ccy_1, ccy_2), self.metrics)
+        self.l2_recorder = None
+        # Bumped before and after every change to the levels (odd while they're changing): lets readers on other
+        # threads (e.g. the API) cache what they serve, and check they copied them whole (see depth_snapshot)
+        self.version = 0
+        # Called on the feed handler thread with (order_book, event_time, bid_q, bid, ask, ask_q) on every BBO change,
+        # before conflation. Copy on write (see add_bbo_listener): the feed handler thread iterates it without a lock
+        self.bbo_listeners = []
+        self._listeners_lock = threading.Lock()
+        # Rolling top of book statistics and their per minute records (book_stats_1m), None when disabled
+        self.stats = BookStats.from_config(exchange, ccy_1, ccy_2)
+        # Set by stop(), wakes the insertion and DB threads up from their wait
+        self._stop_event = threading.Event()
 
     
     def reset(self):
+        # Only the levels are reset: threads keep running and rows not persisted yet are kept
         logger.warning(f"Resetting order book: {self}")
-        self.__init__(self._ccy_1, self._ccy_2, self.exchange)
+        self.version += 1
+        if self.l2_recorder:
+            self.l2_recorder.record_clear(self.last_update)
+        self.last_update = max(self.last_update, datetime.now(pytz.UTC))
+        self.reset_levels()
+        self.version += 1
+        if self.stats:
+            self.stats.reset()
+
+    # Listeners are (un)registered from other threads: the list is replaced, never changed in place, so an iteration
+    # on the feed handler thread carries on over the list it started with
+    def add_bbo_listener(self, listener):
+        with self._listeners_lock:
+            self.bbo_listeners = [*self.bbo_listeners, listener]
+
+    def remove_bbo_listener(self, listener):
+        with self._listeners_lock:
+            self.bbo_listeners = [registered for registered in self.bbo_listeners if registered is not listener]
+
+    def reset_levels(self):
+        pass
+
+    # Called by the feed handler before every (re)connection
+    def warm_start(self):
+        self.reset()
+
+    # Called by the feed handler around the exchange's snapshot
+    def begin_snapshot(self):
+        pass
+
+    def end_snapshot(self):
+        self.snapshot_complete = True
+
+    def depth_snapshot(self):
+        """(last update, bids, asks) with bids and asks as lists of (price, quantity), best first."""
+        return self.last_update, [], []
+
+    # Stops the threads and persists whatever is left, the order book can't be used afterwards
+    def stop(self):
+        logger.info(f"Stopping order book: {self}")
+        self.running = False
+        self._stop_event.set()
+        # From here on rows appended (e.g. by a feed handler thread that didn't stop in time) are refused
+        self._bid_ask_history.close()
+        if self.persist:
+            # Nothing is drained or queued behind the final flush
+            self.insertion_thread.join()
+            self.db_thread.join()
+            with self.lock:
+                data_batch = self.dequeue_batches()
+                data_batch.append(self._bid_ask_history.drain())
+            # The last conflated value goes out with the rest, outside of the closed buffer
+            last_row = BboColumns()
+            self.conflator.flush(float("inf"), last_row)
+            self.flush_to_db(data_batch + [last_row])
+            for batch in data_batch:
+                self._bid_ask_history.release(batch)
+            self.flush_stats(include_current=True)
+            self.save_checkpoint(force=True)
+            if self.l2_recorder:
+                L2Recorder.release(self.exchange, self._ccy_1, self._ccy_2)
+                self.l2_recorder = None
+        self.metrics.unregister()
 
     def init_and_start_threads(self):
         # Multithreading management
         self.lock = threading.Lock()
-        self.running = True
+        self.running = self.persist
+        if not self.persist:
+            return
 
         # Insert order book updates thread:
         self.insertion_thread = threading.Thread(target=self.periodic_insertion)
@@ -60,14 +154,26 @@ class OrderBook(threading.Thread):
         logger.debug(
             f"Periodic insertion thread started with ID {threading.get_ident()} ({self})"
         )
-        while self.running:
+        while not self._stop_event.wait(20):
             try:
-                time.sleep(20)
+                t0 = time.perf_counter()
                 with self.lock:
-                    # Put data in queue
-                    logger.debug(f"Adding {len(self._bid_ask_history)} to queue")
-                    [self.db_queue.put(entry) for entry in self._bid_ask_history]
-                    self._bid_ask_history.clear()
+                    self.metrics.lock_wait.observe(time.perf_counter() - t0)
+                    batch = self._bid_ask_history.drain()
+                    if len(batch):
+                        # Put data in queue
+                        logger.debug(f"Adding {len(batch)} to queue")
+                        now = time.time()
+                        self.db_queue.put((now, batch))
+                        self.metrics.queued_batches.set(self.db_queue.qsize())
+                        enqueue_latency = self.metrics.enqueue_latency
+                        for event_time in batch.time[batch.start:batch.end]:
+                            enqueue_latency.observe(now - event_time)
+                    else:
+                        self._bid_ask_history.release(batch)
+                # After the hand-off and outside the lock: with the block policy this may wait for the DB thread to
+                # release the rows just queued. The conflated row goes out with the next batch.
+                self.conflator.flush(time.time(), self._bid_ask_history)
             except Exception as e:
                 logger.error(f"Error in periodic_insertion: {e}")
                 break
@@ -75,72 +181,120 @@ class OrderBook(threading.Thread):
     # This pulls data from the queue and sends it to flush_to_db for it to be inserted into DB
     def db_worker(self):
         logger.debug(f"DB worker thread started with ID: {threading.get_ident()}")
-        while self.running:
+        while not self._stop_event.is_set():
+            t0 = time.perf_counter()
             with self.lock:
-                data_batch = []
-                while not self.db_queue.empty():
-                    data_batch.append(self.db_queue.get())
+                self.metrics.lock_wait.observe(time.perf_counter() - t0)
+                data_batch = self.dequeue_batches()
             self.flush_to_db(data_batch)
-            time.sleep(10)
+            # Committed or given up on, either way the rows no longer take room
+            for batch in data_batch:
+                self._bid_ask_history.release(batch)
+            self.flush_stats()
+            self.save_checkpoint()
+            self._stop_event.wait(10)
+
+    def dequeue_batches(self):
+        data_batch = []
+        time_in_queue, now = self.metrics.time_in_queue, time.time()
+        while not self.db_queue.empty():
+            enqueue_time, batch = self.db_queue.get()
+            time_in_queue.observe(now - enqueue_time)
+            data_batch.append(batch)
+        self.metrics.queued_batches.set(0)
+        return data_batch
 
     # This builds the insert query and inserts into DB
+    # Rows go as one array per column, the book's identity once per batch
     def flush_to_db(self, data_batch):
-        if data_batch:
+        n_rows = sum(len(batch) for batch in data_batch)
+        if n_rows:
             try:
-                insert_query = f"INSERT INTO order_book (timestamp, currency_1, currency_2, bid_q, bid, ask, ask_q, exchange) VALUES "
+                insert_query = """
+                    INSERT INTO order_book (timestamp, currency_1, currency_2, bid_q, bid, ask, ask_q, exchange)
+                    SELECT to_timestamp(t) AT TIME ZONE 'UTC', %s, %s, NULLIF(bid_q, 'NaN'), NULLIF(bid, 'NaN'), NULLIF(ask, 'NaN'), NULLIF(ask_q, 'NaN'), %s
+                    FROM unnest(%s::float8[], %s::float8[], %s::float8[], %s::float8[], %s::float8[]) AS rows (t, bid_q, bid, ask, ask_q)
+                """
                 logger.debug(f"Flushing to DB: {insert_query}")
 
-                values = [
-                    (
-                        h["event_time"].isoformat(),
-                        self._ccy_1,
-                        self._ccy_2,
-                        h["bid_q"],
-                        h["bid"],
-                        h["ask"],
-                        h["ask_q"],
-                        self.exchange,
-                    )
-                    for h in data_batch
-                ]
-                logger.debug(f"Attempting to insert {len(values)} values")
+                # Each drained array is converted to a list once and goes straight to psycopg2
+                columns = None
+                for batch in data_batch:
+                    if columns is None:
+                        columns = batch.column_lists()
+                    else:
+                        for column, values in zip(columns, batch.column_lists()):
+                            column.extend(values)
+                params = (self._ccy_1, self._ccy_2, self.exchange, *columns)
+                logger.debug(f"Attempting to insert {n_rows} values")
                 for attempt in range(self._max_db_inserts_attempts):
                     try:
                         t0 = time.perf_counter()
-                        db_helper.execute_many(insert_query, values)
-                        logger.info(f"{len(data_batch)} entries added to DB ({(time.perf_counter() - t0) * 1000:.2f}ms)")
+                        db_helper.execute(insert_query, params)
+                        insert_time = time.perf_counter() - t0
+                        logger.info(f"{n_rows} entries added to DB ({insert_time * 1000:.2f}ms)")
+                        self.record_commit(columns[0], insert_time)
                         break
                     except sqlite3.OperationalError as e:
                         logger.exception(f"Sqlite3 OperationError thrown: {e}")
-                        if attempt < self._max_db_inserts_attempts:
+                        if attempt < self._max_db_inserts_attempts - 1:
                             retry_wait = (2.7 ** (attempt + 1))
                             logger.debug(f"Will attempt new insert in {retry_wait:.2f}s")
                             time.sleep(retry_wait)
                         else:
-                            logger.error(f"Insert of {len(values)} values failed after {self._max_db_inserts_attempts} attempts. Data will be missing.")
+                            logger.error(f"Insert of {n_rows} values failed after {self._max_db_inserts_attempts} attempts. Data will be missing.")
+                            self.metrics.dropped_batches.inc()
 
             except sqlite3.Error as e:
                 logger.error(f"SQLite error: {e.args[0]}")
                 logger.error("Exception occurred", exc_info=True)
+                self.metrics.dropped_batches.inc()
             except Exception as e:
                 logger.error(f"General error: {str(e)}")
                 logger.error("Exception occurred", exc_info=True)
+                self.metrics.dropped_batches.inc()
         else:
             logger.info("bid_ask_history empty, skipping...")
 
+    def flush_stats(self, include_current: bool = False):
+        if self.stats is None:
+            return
+        rows = self.stats.pop_minutes(include_current)
+        if rows:
+            try:
+                db_helper.execute_many(
+                    f"INSERT INTO book_stats_1m (exchange, currency_1, currency_2, {', '.join(MINUTE_COLUMNS)}) VALUES ",
+                    [(self.exchange, self._ccy_1, self._ccy_2, *row) for row in rows],
+                )
+            except Exception as e:
+                logger.exception(f"Error while inserting {len(rows)} minutes of stats: {e}")
+
+    def save_checkpoint(self, force: bool = False):
+        pass
+
+    def record_commit(self, event_times, insert_time: float):
+        self.metrics.db_insert_time.observe(insert_time)
+        self.metrics.rows_committed.inc(len(event_times))
+        commit_latency, now = self.metrics.commit_latency, time.time()
+        for event_time in event_times:
+            commit_latency.observe(now - event_time)
+
     # Dunder methods...
     def __str__(self) -> str:
         return f"[OrderBook] [{self.exchange}:{self._ccy_1}/{self._ccy_2}] #TODO"
 
 class BestBidOfferOrderBook(OrderBook):
-    def __init__(self, ccy_1: str, ccy_2: str, exchange: str) -> None:
-        super().__init__(ccy_1=ccy_1, ccy_2=ccy_2, exchange=exchange)
+    def __init__(self, ccy_1: str, ccy_2: str, exchange: str, persist: bool = True) -> None:
+        super().__init__(ccy_1=ccy_1, ccy_2=ccy_2, exchange=exchange, persist=persist)
+        self.reset_levels()
+        self.init_and_start_threads()
+
+    def reset_levels(self):
         self._best_bid = None
         self._best_bid_q = None
         self._best_ask = None
         self._best_ask_q = None
         self.snapshot_complete = False
-        self.init_and_start_threads()
 
 
     def set_bid_ask(self, bid: float, bid_q: float, ask: float, ask_q: float, event_time: datetime):
@@ -149,28 +303,44 @@ class BestBidOfferOrderBook(OrderBook):
         self._best_ask = ask
         self._best_ask_q = ask_q
         self.last_update = event_time
+        self.version += 1
         self.register_best_bid_offer()
 
+    def depth_snapshot(self):
+        last_update, bid, bid_q, ask, ask_q = self.last_update, self._best_bid, self._best_bid_q, self._best_ask, self._best_ask_q
+        return last_update, [(bid, bid_q)] if bid is not None else [], [(ask, ask_q)] if ask is not None else []
+
     def register_best_bid_offer(self) -> None: 
             if self.snapshot_complete:
-                self._bid_ask_history.append(
-                    {
-                        "event_time": self.last_update,
-                        "bid_q": self._best_bid_q,
-                        "bid": self._best_bid,
-                        "ask": self._best_ask,
-                        "ask_q": self._best_ask_q,
-                    }
-                ) 
-                logger.debug(f"register_best_bid_offer: self._bid_ask_history now size {len(self._bid_ask_history)}")
+                event_time, bid_q, bid, ask, ask_q = self.last_update, self._best_bid_q, self._best_bid, self._best_ask, self._best_ask_q
+                for listener in self.bbo_listeners:
+                    listener(self, event_time, bid_q, bid, ask, ask_q)
+                timestamp = event_time.timestamp()
+                if self.stats:
+                    self.stats.update(timestamp, bid_q, bid, ask, ask_q)
+                self.conflator.offer(self._bid_ask_history, timestamp, bid_q, bid, ask, ask_q)
+                self.metrics.bbo_changes.inc()
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("register_best_bid_offer: self._bid_ask_history now size %d", len(self._bid_ask_history))
             else:
-                logger.warning(f"Still loading snapshot, can't register best bid offer just yet...")
+                logger.warning("Still loading snapshot, can't register best bid offer just yet...")
 
     
 
 class FullOrderBook(OrderBook):
-    def __init__(self, ccy_1: str, ccy_2: str, exchange: str) -> None:
-        super().__init__(ccy_1=ccy_1, ccy_2=ccy_2, exchange=exchange)
+    def __init__(self, ccy_1: str, ccy_2: str, exchange: str, persist: bool = True) -> None:
+        super().__init__(ccy_1=ccy_1, ccy_2=ccy_2, exchange=exchange, persist=persist)
+        self.reset_levels()
+        # Full depth deltas and periodic snapshots (see database.l2_store)
+        l2_storage = persist and config.get("order_book.l2_storage.enabled", False)
+        self.l2_recorder = L2Recorder.for_book(exchange, ccy_1, ccy_2) if l2_storage else None
+        # Levels saved periodically, to seed the book on restart (see warm_start)
+        self.checkpoints = BookCheckpoints.from_config(exchange, ccy_1, ccy_2) if persist else None
+        # Levels the book was seeded with, until reconciled with the exchange's snapshot: (source, bids, asks)
+        self._seed = None
+        self.init_and_start_threads()
+
+    def reset_levels(self):
         self._bids = SortedDict(lambda x: -x)
         self._asks = SortedDict()
         self._last_best_bid = None
@@ -178,29 +348,109 @@ class FullOrderBook(OrderBook):
         self._last_best_ask = None
         self._last_best_ask_q = None
         self.snapshot_complete = False
-        self.init_and_start_threads()
+
+    def warm_start(self):
+        """
+        Keeps the book ready while (re)connecting: on a reconnect the levels in memory are kept, on a restart the
+        book is seeded from its checkpoint, as long as they're no older than checkpoints.max_age_s. The seed is
+        replaced (and reconciled) by the exchange's snapshot, see begin_snapshot/end_snapshot.
+        """
+        max_age = self.checkpoints.max_age if self.checkpoints else 0
+        age = (datetime.now(pytz.UTC) - self.last_update).total_seconds()
+        if self.snapshot_complete and self._bids and self._asks and age <= max_age:
+            self._seed = ("memory", dict(self._bids), dict(self._asks))
+            logger.info(f"Warm start from the levels in memory ({age:.1f}s old): {self}")
+            self.metrics.warm_starts.inc()
+            return
+        checkpoint = self.checkpoints.load() if self.checkpoints and not self.snapshot_complete else None
+        if checkpoint is None:
+            self._seed = None
+            self.reset()
+            return
+        last_update, bids, asks = checkpoint
+        self.version += 1
+        self.reset_levels()
+        self._bids.update(bids)
+        self._asks.update(asks)
+        while len(self._bids) > self.depth:
+            self._bids.popitem()
+        while len(self._asks) > self.depth:
+            self._asks.popitem()
+        # Never back in time: rows already persisted may be more recent than the checkpoint
+        self.last_update = max(self.last_update, last_update)
+        # Already recorded before the restart: not a BBO change. Best first whatever the order in the file
+        self._last_best_bid, self._last_best_bid_q = next(iter(self._bids.items()), (None, None))
+        self._last_best_ask, self._last_best_ask_q = next(iter(self._asks.items()), (None, None))
+        self.snapshot_complete = True
+        self.version += 1
+        self._seed = ("checkpoint", dict(bids), dict(asks))
+        logger.info(f"Warm start from checkpoint ({(datetime.now(pytz.UTC) - last_update).total_seconds():.1f}s old): {self}")
+        self.metrics.warm_starts.inc()
+
+    def begin_snapshot(self):
+        # The snapshot replaces the levels: no BBO (nor checkpoint) until it's complete
+        self.version += 1
+        self.snapshot_complete = False
+        if self._bids or self._asks:
+            if self.l2_recorder:
+                self.l2_recorder.record_clear(self.last_update)
+            self._bids = SortedDict(lambda x: -x)
+            self._asks = SortedDict()
+        self.version += 1
+
+    def end_snapshot(self):
+        self.snapshot_complete = True
+        if self._seed is not None:
+            self.log_reconciliation(*self._seed)
+            self._seed = None
+
+    def log_reconciliation(self, source: str, seed_bids: dict, seed_asks: dict):
+        counts = {"unchanged": 0, "changed": 0, "added": 0, "removed": 0}
+        for seed, levels in ((seed_bids, self._bids), (seed_asks, self._asks)):
+            for price, quantity in levels.items():
+                if price not in seed:
+                    counts["added"] += 1
+                else:
+                    counts["unchanged" if seed[price] == quantity else "changed"] += 1
+            counts["removed"] += sum(1 for price in seed if price not in levels)
+        for outcome, count in counts.items():
+            self.metrics.reconciled_levels[outcome].inc(count)
+        seed_bbo = (next(iter(sorted(seed_bids, reverse=True)), None), next(iter(sorted(seed_asks)), None))
+        bbo = (next(iter(self._bids), None), next(iter(self._asks), None))
+        logger.info(f"Reconciled {source} seed with the exchange snapshot: {counts['unchanged']} levels unchanged, "
+                    f"{counts['changed']} changed, {counts['added']} added, {counts['removed']} removed, "
+                    f"BBO {seed_bbo[0]}/{seed_bbo[1]} -> {bbo[0]}/{bbo[1]}: {self}")
+
+    def save_checkpoint(self, force: bool = False):
+        if self.checkpoints is None or not (force or self.checkpoints.due()):
+            return
+        try:
+            snapshot_complete, last_update, bids, asks = self._copy_levels()
+            if snapshot_complete:
+                self.checkpoints.save(last_update, bids, asks)
+        except Exception as e:
+            logger.exception(f"Error while saving the checkpoint of {self}: {e}")
 
     def register_best_bid_offer(self) -> None: 
             if self.snapshot_complete:
                 best_bid, best_bid_q = next(iter(self._bids.items()), (None, None))
                 best_ask, best_ask_q = next(iter(self._asks.items()), (None, None))
                 if (self._last_best_bid, self._last_best_bid_q, self._last_best_ask, self._last_best_ask_q) != (best_bid, best_bid_q, best_ask, best_ask_q):
-                    self._bid_ask_history.append(
-                        {
-                            "event_time": self.last_update,
-                            "bid_q": best_bid_q,
-                            "bid": best_bid,
-                            "ask": best_ask,
-                            "ask_q": best_ask_q,
-                        }
-                    )
-                        
-                    logger.debug(f"register_best_bid_offer: self._bid_ask_history now size {len(self._bid_ask_history)}")
+                    for listener in self.bbo_listeners:
+                        listener(self, self.last_update, best_bid_q, best_bid, best_ask, best_ask_q)
+                    timestamp = self.last_update.timestamp()
+                    if self.stats:
+                        self.stats.update(timestamp, best_bid_q, best_bid, best_ask, best_ask_q)
+                    self.conflator.offer(self._bid_ask_history, timestamp, best_bid_q, best_bid, best_ask, best_ask_q)
+
+                    self.metrics.bbo_changes.inc()
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("register_best_bid_offer: self._bid_ask_history now size %d", len(self._bid_ask_history))
                     self._last_best_bid, self._last_best_bid_q, self._last_best_ask, self._last_best_ask_q = best_bid, best_bid_q, best_ask, best_ask_q
-                else:
+                elif logger.isEnabledFor(logging.DEBUG):
                     logger.debug("No change to BBO")
             else:
-                logger.warning(f"Still loading snapshot, can't register best bid offer just yet...")
+                logger.warning("Still loading snapshot, can't register best bid offer just yet...")
     
     def set_bid(self, bid: float, bid_q: float, event_time: datetime):
         self.register_tick(bid_ask='bid', price=bid, quantity=bid_q, event_time=event_time)
@@ -209,31 +459,61 @@ class FullOrderBook(OrderBook):
         self.register_tick(bid_ask='ask', price=ask, quantity=ask_q, event_time=event_time)
 
     def register_tick(self, bid_ask: Literal['bid', 'ask'], price: float, quantity: float, event_time: datetime):
-        # If we're on a new event time, save the current BBO
-        if event_time > self.last_update:
-            logger.debug(f"register_tick - event_time = {event_time} newer than self.last_update = {self.last_update}")
-            self.register_best_bid_offer()
-            self.last_update = event_time
-        # New limit or modified quantity on existing limit
-        if quantity > 0:
-            if bid_ask == 'bid':
-                self._bids[price] = quantity
-            else:
-                self._asks[price] = quantity
-        # Limit gone, to remove
-        else:
-            if bid_ask == 'bid':
-                if price in self._bids:
-                    del self._bids[price]
+        self.version += 1
+        try:
+            # If we're on a new event time, save the current BBO
+            if event_time > self.last_update:
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("register_tick - event_time = %s newer than self.last_update = %s", event_time, self.last_update)
+                self.register_best_bid_offer()
+                # Snapshots are only taken between two event times, so they hold every delta up to self.last_update
+                if self.l2_recorder and self.l2_recorder.snapshot_due(self.last_update):
+                    self.l2_recorder.record_snapshot(self._bids, self._asks, self.depth, self.last_update)
+                self.last_update = event_time
+            self.metrics.levels.inc()
+            if self.l2_recorder:
+                # Deltas use the book's (monotonic) time rather than event_time, which could go backwards
+                self.l2_recorder.record(BID if bid_ask == 'bid' else ASK, price, quantity, self.last_update)
+            # New limit or modified quantity on existing limit
+            if quantity > 0:
+                if bid_ask == 'bid':
+                    self._bids[price] = quantity
+                else:
+                    self._asks[price] = quantity
+            # Limit gone, to remove
             else:
-                if price in self._asks:
-                    del self._asks[price] 
+                if bid_ask == 'bid':
+                    if price in self._bids:
+                        del self._bids[price]
+                else:
+                    if price in self._asks:
+                        del self._asks[price] 
 
-        while len(self._bids) > self.depth:
-            self._bids.popitem()
+            while len(self._bids) > self.depth:
+                self._bids.popitem()
 
-        while len(self._asks) > self.depth:
-            self._asks.popitem()
+            while len(self._asks) > self.depth:
+                self._asks.popitem()
+        finally:
+            self.version += 1
+
+    def depth_snapshot(self):
+        return self._copy_levels()[1:]
+
+    def _copy_levels(self):
+        # Usually called from another thread than the feed handler's, which doesn't lock the levels: the copy only
+        # counts if version was even and didn't move while copying, else it's tried again a little later
+        for _ in range(COPY_LEVELS_ATTEMPTS):
+            version = self.version
+            if not version & 1:
+                try:
+                    copy = self.snapshot_complete, self.last_update, list(self._bids.items()), list(self._asks.items())
+                except (RuntimeError, KeyError, IndexError):
+                    copy = None
+                if copy is not None and self.version == version:
+                    return copy
+            time.sleep(0.001)
+        raise RuntimeError(f"Levels kept changing during {COPY_LEVELS_ATTEMPTS} attempts at copying them")
 
     # Dunder methods...
     def __str__(self):
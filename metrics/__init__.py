@@ -0,0 +1,5 @@
+from .metrics import registry, BookMetrics, Counter, Gauge, Histogram
+from .metrics_server import start_metrics_server
+from .startup import StartupReport
+
+__all__ = ["registry", "BookMetrics", "Counter", "Gauge", "Histogram", "start_metrics_server", "StartupReport"]
@@ -0,0 +1,172 @@
+from bisect import bisect_left
+from threading import Lock
+from typing import Dict, List, Tuple
+
+# Lightweight, dependency free metrics rendered in the Prometheus text exposition format.
+# Updates are deliberately not locked: each metric is written to by a single thread (feed handler or DB thread)
+# and the GIL makes a lost increment very unlikely. Only registration (rare) takes a lock.
+
+# Seconds, from 100us to 2min: covers parsing (sub-ms) up to DB commit latency (periodic insertion is every 20s)
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    __slots__ = ("labels", "value")
+
+    def __init__(self, labels: Tuple[Tuple[str, str], ...] = ()):
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+
+class Gauge(Counter):
+    __slots__ = ()
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Histogram:
+    __slots__ = ("labels", "buckets", "counts", "sum")
+
+    def __init__(self, labels: Tuple[Tuple[str, str], ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.labels = labels
+        self.buckets = buckets
+        # One extra slot for +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def quantile(self, q: float) -> float:
+        # Upper bound of the bucket holding the q-th quantile, good enough for logs and benchmarks
+        target = q * self.count
+        cumulative = 0
+        for upper_bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            if cumulative >= target and cumulative > 0:
+                return upper_bound
+        return 0.0
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._lock = Lock()
+        # name -> (type, help, {labels: metric})
+        self._families: Dict[str, Tuple[str, str, Dict[tuple, object]]] = {}
+
+    def _get_or_create(self, metric_type: str, name: str, help: str, labels: Dict[str, str], factory):
+        label_items = tuple(sorted(labels.items()))
+        family = self._families.get(name)
+        if family is not None and label_items in family[2]:
+            return family[2][label_items]
+        with self._lock:
+            family = self._families.setdefault(name, (metric_type, help, {}))
+            if family[0] != metric_type:
+                raise ValueError(f"Metric {name} already registered as a {family[0]}")
+            if label_items not in family[2]:
+                family[2][label_items] = factory(label_items)
+            return family[2][label_items]
+
+    def counter(self, name: str, help: str, **labels: str) -> Counter:
+        return self._get_or_create("counter", name, help, labels, Counter)
+
+    def gauge(self, name: str, help: str, **labels: str) -> Gauge:
+        return self._get_or_create("gauge", name, help, labels, Gauge)
+
+    def histogram(self, name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **labels: str) -> Histogram:
+        return self._get_or_create("histogram", name, help, labels, lambda label_items: Histogram(label_items, buckets))
+
+    def remove(self, **labels: str) -> None:
+        """Drops every metric carrying all of the given labels, e.g. those of a book removed from the universe."""
+        label_items = set(labels.items())
+        with self._lock:
+            for family in self._families.values():
+                for key in [key for key in family[2] if label_items <= set(key)]:
+                    del family[2][key]
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            families = [(name, family[0], family[1], list(family[2].values())) for name, family in sorted(self._families.items())]
+        for name, metric_type, help, metrics in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for metric in metrics:
+                if metric_type == "histogram":
+                    cumulative = 0
+                    for upper_bound, count in zip(metric.buckets + ("+Inf",), metric.counts):
+                        cumulative += count
+                        bucket_labels = _format_labels(metric.labels, 'le="%s"' % upper_bound)
+                        lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(metric.labels)} {metric.sum}")
+                    lines.append(f"{name}_count{_format_labels(metric.labels)} {cumulative}")
+                else:
+                    lines.append(f"{name}{_format_labels(metric.labels)} {metric.value}")
+        lines.append("")
+        return "\n".join(lines)
+
+
+registry = MetricsRegistry()
+
+
+class BookMetrics:
+    """
+    Latency histograms and counters of one order book, along its pipeline:
+    exchange event -> socket receive -> parsed -> applied to the book -> enqueued for the DB -> committed to the DB.
+    Instances are shared across order book resets (reconnects), so counters keep accumulating.
+    """
+
+    def __init__(self, exchange: str, ccy_1: str, ccy_2: str):
+        labels = self.labels = {"exchange": exchange, "instrument": f"{ccy_1}/{ccy_2}"}
+        # Latencies
+        self.feed_latency = registry.histogram("arb_finder_feed_latency_seconds", "Socket receive time minus exchange event time", **labels)
+        self.parse_time = registry.histogram("arb_finder_parse_seconds", "Time spent decoding a websocket message", **labels)
+        self.apply_time = registry.histogram("arb_finder_apply_seconds", "Time spent applying a decoded message to the order book", **labels)
+        self.enqueue_latency = registry.histogram("arb_finder_enqueue_latency_seconds", "DB queue enqueue time minus exchange event time", **labels)
+        self.commit_latency = registry.histogram("arb_finder_commit_latency_seconds", "DB commit time minus exchange event time", **labels)
+        self.lock_wait = registry.histogram("arb_finder_lock_wait_seconds", "Time spent waiting for OrderBook.lock", **labels)
+        self.db_insert_time = registry.histogram("arb_finder_db_insert_seconds", "Duration of one batch insert", **labels)
+        self.time_in_queue = registry.histogram("arb_finder_time_in_queue_seconds", "Time batches wait in the DB queue before being picked up", **labels)
+        self.buffer_block_time = registry.histogram("arb_finder_buffer_block_seconds", "Time appends spent waiting for room in a full buffer (block policy)", **labels)
+        # Buffers
+        self.buffered_rows = registry.gauge("arb_finder_buffered_rows", "Rows held in memory until persisted (buffered or queued for the DB)", **labels)
+        self.buffer_capacity = registry.gauge("arb_finder_buffer_capacity", "Max rows held in memory until persisted", **labels)
+        self.queued_batches = registry.gauge("arb_finder_queued_batches", "Batches in the DB queue", **labels)
+        # Counters
+        self.messages = registry.counter("arb_finder_messages_total", "Websocket messages received", **labels)
+        self.levels = registry.counter("arb_finder_levels_total", "Price level updates applied to the order book", **labels)
+        self.bbo_changes = registry.counter("arb_finder_bbo_changes_total", "Best bid/offer changes seen", **labels)
+        self.bbo_rows_saved = registry.counter("arb_finder_bbo_rows_saved_total", "Best bid/offer rows kept for the DB after conflation", **labels)
+        self.bbo_rows_filtered = registry.counter("arb_finder_bbo_rows_filtered_total", "Best bid/offer changes dropped by the change thresholds", **labels)
+        self.bbo_rows_conflated = registry.counter("arb_finder_bbo_rows_conflated_total", "Best bid/offer rows replaced by a later one within the conflation interval", **labels)
+        self.reconnects = registry.counter("arb_finder_reconnects_total", "Websocket (re)connections after the first one", **labels)
+        self.rows_committed = registry.counter("arb_finder_rows_committed_total", "Order book rows committed to the DB", **labels)
+        self.dropped_batches = registry.counter("arb_finder_dropped_batches_total", "Batches that could not be inserted in the DB", **labels)
+        self.buffer_blocked = registry.counter("arb_finder_buffer_blocked_total", "Appends that had to wait for room in a full buffer (block policy)", **labels)
+        self.buffer_conflated = registry.counter("arb_finder_buffer_conflated_total", "Buffered rows replaced by a newer one on overflow (conflate policy)", **labels)
+        self.buffer_dropped = registry.counter("arb_finder_buffer_dropped_total", "Rows dropped on buffer overflow", **labels)
+        self.warm_starts = registry.counter("arb_finder_warm_starts_total", "(Re)connections served from a checkpoint or the levels in memory until the exchange snapshot", **labels)
+        self.reconciled_levels = {outcome: registry.counter("arb_finder_reconciled_levels_total", "Seeded levels compared with the exchange snapshot", outcome=outcome, **labels)
+                                  for outcome in ("unchanged", "changed", "added", "removed")}
+
+    def unregister(self) -> None:
+        # Every series of the book (these and e.g. its BookStats gauges) stops being exported
+        registry.remove(**self.labels)
\ No newline at end of file
@@ -0,0 +1,34 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+from logger import get_logger
+from metrics.metrics import registry
+
+logger = get_logger(__name__)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would otherwise flood stderr
+        pass
+
+
+def start_metrics_server(host: str = "127.0.0.1", port: int = 9108) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    server.daemon_threads = True
+    metrics_thread = threading.Thread(target=server.serve_forever, name="metrics_server")
+    metrics_thread.daemon = True
+    metrics_thread.start()
+    logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,36 @@
+from typing import List, Tuple
+import time
+from logger import get_logger
+from metrics.metrics import registry
+
+logger = get_logger(__name__)
+
+
+class StartupReport:
+    """
+    Time spent in each phase of a start up (imports, DB connection, first books...), measured from start_time
+    (time.perf_counter()). report() logs it and exports it as arb_finder_startup_seconds{process, phase}.
+    """
+
+    def __init__(self, process: str, start_time: float = None):
+        self.process = process
+        self.start_time = start_time if start_time is not None else time.perf_counter()
+        self._last = self.start_time
+        self.phases: List[Tuple[str, float]] = []
+
+    def phase(self, name: str) -> None:
+        """Ends the current phase, started at the end of the previous one."""
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    @property
+    def total(self) -> float:
+        return self._last - self.start_time
+
+    def report(self) -> None:
+        for name, duration in self.phases:
+            registry.gauge("arb_finder_startup_seconds", "Duration of each start up phase", process=self.process, phase=name).set(duration)
+        registry.gauge("arb_finder_startup_seconds", "Duration of each start up phase", process=self.process, phase="total").set(self.total)
+        breakdown = ", ".join(f"{name} {duration * 1000:.0f}ms" for name, duration in self.phases)
+        logger.info(f"{self.process} started in {self.total * 1000:.0f}ms ({breakdown})")
@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+import pytest
+from market.conflation import BboConflator, ConflationPolicy
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class History(list):
+    def append(self, *row) -> None:
+        super().append(row)
+
+
+def conflate(event_times, min_interval_ms=100, flush_at=None):
+    metrics = SimpleNamespace(bbo_rows_saved=Counter(), bbo_rows_filtered=Counter(), bbo_rows_conflated=Counter())
+    conflator = BboConflator(ConflationPolicy(min_interval_ms=min_interval_ms), metrics)
+    history = History()
+    for i, event_time in enumerate(event_times):
+        # Every change moves the bid, so none of them is filtered
+        conflator.offer(history, event_time, 1.0, 100.0 + i, 200.0, 1.0)
+    if flush_at is not None:
+        conflator.flush(flush_at, history)
+    return history, metrics
+
+
+@pytest.mark.parametrize("event_times", [
+    [0, .01, .05, .12, .13, .5],
+    [0, .099, .1, .2],
+    [0, .05, .1, .15, .2, .25, .3, .301, .302, .45, .9, .95, .999, 1.0, 1.001],
+    [i / 1000 for i in range(0, 2000, 7)],
+])
+def test_saved_rows_are_min_interval_apart(event_times):
+    history, metrics = conflate(event_times, flush_at=float("inf"))
+    times = [row[0] for row in history]
+    assert all(later - earlier >= .1 - 1e-9 for earlier, later in zip(times, times[1:]))
+    assert metrics.bbo_rows_saved.value + metrics.bbo_rows_conflated.value == len(event_times)
+
+
+def test_last_value_is_saved_as_of_the_end_of_the_interval():
+    history, _ = conflate([0, .01, .05, .12, .13, .5], flush_at=float("inf"))
+    assert [(row[0], row[2]) for row in history] == [(0, 100.0), (.1, 102.0), (.2, 104.0), (.5, 105.0)]
+
+
+def test_flush_waits_for_the_end_of_the_interval():
+    history, _ = conflate([0, .05], flush_at=.09)
+    assert [row[0] for row in history] == [0]
+    history, _ = conflate([0, .05], flush_at=.1)
+    assert [(row[0], row[2]) for row in history] == [(0, 100.0), (.1, 101.0)]
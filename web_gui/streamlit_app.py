@@ -1,22 +1,21 @@
+import time
+page_load_start = time.time()
+start_time = time.perf_counter()
 import pandas as pd
-import numpy as np
-from sqlalchemy import create_engine
-import plotly.graph_objects as go
-import plotly.express as px
 import streamlit as st
 st.set_page_config(layout="wide")
 
-from datetime import datetime
-from crypto_arb_finder.config import config, secrets
-import time
+from crypto_arb_finder.config import config
 from crypto_arb_finder.logger import get_logger
-from streamlit_helper import get_exchanges, get_currencies_1, get_data, build_bid_ask_plot, build_spreads_plot, get_arb_figures
+from metrics import StartupReport
+from streamlit_helper import get_exchanges, get_currencies_1, get_data, build_bid_ask_plot, build_spreads_plot, get_arb_figures, get_arb_episodes, get_book_stats, decimate
 
 
 logger = get_logger(__name__)
 
-
-page_load_start = time.time()
+# Timed on every run of the script (page load or interaction), cached data makes the following ones faster
+startup_report = StartupReport("web GUI", start_time)
+startup_report.phase("imports")
 
 time_horizon = config.web_gui.time_horizon_in_hours
 logger.debug(f"Time horizon: {time_horizon} hours")
@@ -25,11 +24,14 @@ start = time.time()
 exchanges = get_exchanges()
 start = time.time()
 currencies_1 = get_currencies_1()
+startup_report.phase("exchanges and currencies")
 start = time.time()
 st.toast(f"Fetching data...")
 bid_ask_df = get_data(time_horizon_in_hours=time_horizon)
+stats_df = get_book_stats(time_horizon_in_hours=time_horizon)
 st.toast("Data retrieved.")
 logger.debug(f"get_data() took {time.time() - start:.2f}")
+startup_report.phase("data")
 
 
 
@@ -53,6 +55,12 @@ with arb_container:
     for fig in get_arb_figures(time_horizon_in_hours=time_horizon, currency_1=currency_1, taking_fees=taking_fees):
          st.plotly_chart(fig)
 
+    episodes_df = get_arb_episodes(time_horizon_in_hours=time_horizon, currency_1=currency_1)
+    st.markdown(f"###### {currency_1}/USD - Recorded episodes ({len(episodes_df)})")
+    st.caption("Detected with the fees of the arb_episodes section of config.yaml, not the ones above.")
+    if episodes_df.size:
+         st.dataframe(episodes_df, hide_index=True)
+
 with exchanges_container:
     st.subheader("Breakdown per exchange")
     for exchange in exchanges:
@@ -65,6 +73,7 @@ with exchanges_container:
          if current_bid_ask_df.size == 0:
               st.warning(f"No data found for {currency_1}/USD on {exchange} over the past {time_horizon} hours.")
               continue
+         current_stats_df = stats_df[(stats_df['exchange'] == exchange) & (stats_df['currency_1'] == currency_1) & (stats_df['currency_2'] == currency_2)]
 
          with columns[0]:
               # Display the plotly figure in Streamlit
@@ -72,18 +81,24 @@ with exchanges_container:
               st.plotly_chart(build_bid_ask_plot(current_bid_ask_df,  exchange, currency_1))
          with columns[1]:
               # Display the plotly figure in Streamlit
-              volumes_df = pd.DataFrame({
-                   'bid_q': current_bid_ask_df['bid_q'],
-                   'ask_q': -current_bid_ask_df['ask_q']
-              })
+              if current_stats_df.size:
+                   # Per minute mean sizes from book_stats_1m
+                   volumes_df = pd.DataFrame({'bid_q': current_stats_df['bid_q_mean'], 'ask_q': -current_stats_df['ask_q_mean']})
+              else:
+                   volumes_df = pd.DataFrame({
+                        'bid_q': decimate(current_bid_ask_df['bid_q']),
+                        'ask_q': decimate(-current_bid_ask_df['ask_q'])
+                   })
               st.markdown(f"###### {exchange} - {currency_1}/USD - Volume Spread")
               st.bar_chart(volumes_df, color=['#A2E3C4', '#D90368'])
                
          with columns[2]:
               # Display the plotly figure in Streamlit
               st.markdown(f"###### {exchange} - {currency_1}/USD - Spreads")
-              st.plotly_chart(build_spreads_plot(current_bid_ask_df,  exchange, currency_1))
+              st.plotly_chart(build_spreads_plot(current_bid_ask_df,  exchange, currency_1, current_stats_df))
               
          logger.debug(f"Plotting {exchange} took {time.time() - start:.2f}")
 
+startup_report.phase("figures")
+startup_report.report()
 st.markdown(f"<p class='footnote'>Page generated in {time.time() - page_load_start:.2f} seconds.</p>", unsafe_allow_html=True)
@@ -1,40 +1,51 @@
-import pandas as pd
 import numpy as np
-from sqlalchemy import create_engine
-import plotly.graph_objects as go
-import plotly.express as px
+import pandas as pd
 import streamlit as st
-from crypto_arb_finder.config import config, secrets
+from crypto_arb_finder.config import config
 from crypto_arb_finder.logger import get_logger
+from database import db_helper, fetch_episodes
 import time
-from typing import List, Dict
-
-
-logger = get_logger(__name__)
+from datetime import datetime, timedelta
+import pytz
+from typing import Iterable, List, Dict, TYPE_CHECKING
 
-db_params = {
-    'dbname': config.database.db_name,
-    'host': config.database.db_host,
-    'user': config.database.db_user,
-    'password': secrets.database_password,
-    'port': config.database.db_port
-}
+# plotly takes longer to import than the rest of the page's modules: deferred to the first figure built
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
 
-db_url = f"postgresql+psycopg2://{db_params['user']}:{db_params['password']}@{db_params['host']}:{db_params['port']}/{db_params['dbname']}"
-# Create a SQLAlchemy engine
-engine = create_engine(db_url)
 
+logger = get_logger(__name__)
 
 
 @st.cache_data
 def get_exchanges():
     exchanges_query = "SELECT exchange FROM exchanges"
-    return pd.read_sql_query(exchanges_query, engine)['exchange'].tolist()
+    return [exchange for (exchange,) in db_helper.fetch_all(exchanges_query)]
 
 @st.cache_data
 def get_currencies_1():
     exchanges_query = "SELECT currency FROM currencies"
-    return pd.read_sql_query(exchanges_query, engine)['currency'].tolist()
+    return [currency for (currency,) in db_helper.fetch_all(exchanges_query)]
+
+@st.cache_data(ttl=60)
+def get_arb_episodes(time_horizon_in_hours: float, currency_1: str) -> pd.DataFrame:
+    # Indexed lookup in arb_episodes (see market.arb_detector), not a scan of the ticks
+    start = datetime.now(pytz.UTC) - timedelta(hours=time_horizon_in_hours)
+    return pd.DataFrame(fetch_episodes(currency_1, start=start))
+
+@st.cache_data(ttl=60)
+def get_book_stats(time_horizon_in_hours: float) -> pd.DataFrame:
+    # Per minute records computed by the order books (see market.book_stats), a few rows per book and hour
+    stats_query = """
+    SELECT minute, exchange, currency_1, currency_2, updates, spread_bps_mean, spread_bps_min, spread_bps_max, bid_q_mean, ask_q_mean
+    FROM book_stats_1m
+    WHERE minute >= %s
+    ORDER BY minute
+    """
+    start = (datetime.now(pytz.UTC) - timedelta(hours=time_horizon_in_hours)).replace(tzinfo=None)
+    columns = ["minute", "exchange", "currency_1", "currency_2", "updates", "spread_bps_mean", "spread_bps_min",
+               "spread_bps_max", "bid_q_mean", "ask_q_mean"]
+    return pd.DataFrame(db_helper.fetch_all(stats_query, (start,)), columns=columns).set_index("minute")
 
 @st.cache_data
 def get_data(time_horizon_in_hours: float):
@@ -56,59 +67,107 @@ def get_data(time_horizon_in_hours: float):
         timestamp >= NOW() - INTERVAL '{time_horizon_in_hours} hours'
     ORDER BY timestamp
     """
-    bid_ask_df = pd.read_sql_query(bid_ask_query, engine)
-    bid_ask_df.set_index('timestamp', inplace=True)
-    logger.debug(f"get_data: retrieved {bid_ask_df.size} entries")
-    
-    if not bid_ask_df.index.is_unique:
-        bid_ask_df = bid_ask_df[~bid_ask_df.index.duplicated(keep='last')]
+    # Raw rows are streamed and resampled chunk by chunk: only the per second aggregates are ever held in memory
+    bid_ask_df_resampled = resample_chunks(db_helper.iter_chunks(bid_ask_query, as_dataframe=True))
+
+    logger.debug(f"get_data: resampled (per second) to {bid_ask_df_resampled.size} entries")
+    logger.debug(f"get_data complete in {time.time() - start:.2f} seconds")
+    return bid_ask_df_resampled
+
 
-    # Resample and calculate the sums and averages
-    def resample_group(group):
-        logger.debug(f"Resampling group with keys: {group.name}")
-        logger.debug(f"Group head:\n{group.head()}")
-        try:
-            resampled_group = group.resample('s').apply({
-                'bid_q': 'sum',
-                'bid': 'mean',
-                'ask_q': 'sum',
-                'ask': 'mean'
-            }).dropna()
-            
-            # Add the static columns back to the resampled DataFrame
-            resampled_group['exchange'] = group['exchange'].iloc[0]
-            resampled_group['currency_1'] = group['currency_1'].iloc[0]
-            resampled_group['currency_2'] = group['currency_2'].iloc[0]
-            
-            return resampled_group
-        except KeyError as e:
-            logger.error(f"KeyError during resampling: {e}")
-            logger.debug(f"Group causing KeyError:\n{group}")
-            raise e
-        except Exception as e:
-            logger.error(f"General error during resampling: {e}")
-            logger.debug(f"Group causing error:\n{group}")
-            raise e
+# Resamples raw order_book rows (indexed by timestamp) to one data point per second for each exchange/currency pair:
+# bid_q/ask_q are summed, bid/ask averaged over the second
+def resample_bid_ask(bid_ask_df: pd.DataFrame) -> pd.DataFrame:
+    return combine_resampled_bid_ask([partial_resample_bid_ask(bid_ask_df)])
 
+
+# Per second sums and counts of a chunk of raw rows. Unlike means, these can be combined across chunks, which
+# lets get_data resample a stream of chunks exactly.
+def partial_resample_bid_ask(bid_ask_df: pd.DataFrame) -> pd.DataFrame:
+    if not bid_ask_df.index.is_unique:
+        bid_ask_df = bid_ask_df[~bid_ask_df.index.duplicated(keep='last')]
     try:
-        bid_ask_df_resampled = bid_ask_df.groupby(['exchange', 'currency_1', 'currency_2']).apply(resample_group)
-        bid_ask_df_resampled.reset_index(level=['exchange', 'currency_1', 'currency_2'], drop=True, inplace=True)
+        return bid_ask_df.groupby(['exchange', 'currency_1', 'currency_2', bid_ask_df.index.floor('s').rename('timestamp')]).agg(
+            bid_q=('bid_q', 'sum'),
+            bid_sum=('bid', 'sum'),
+            bid_count=('bid', 'count'),
+            ask_q=('ask_q', 'sum'),
+            ask_sum=('ask', 'sum'),
+            ask_count=('ask', 'count'),
+        )
     except Exception as e:
         logger.error(f"Error during resampling: {e}")
         raise e
 
-    logger.debug(f"get_data: resampled (per second) to {bid_ask_df_resampled.size} entries")
-    logger.debug(f"get_data complete in {time.time() - start:.2f} seconds")
+
+def resample_chunks(chunks: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    """Same as resample_bid_ask over the concatenation of chunks of raw rows, ordered by timestamp."""
+    partials = []
+    rows = 0
+    carried = None
+    for chunk in chunks:
+        chunk = chunk.set_index('timestamp')
+        rows += len(chunk)
+        if carried is not None:
+            chunk = pd.concat([carried, chunk])
+        if chunk.empty:
+            continue
+        # Rows sharing the chunk's last timestamp may go on in the next chunk: held back, so that duplicated timestamps
+        # are removed across chunks too
+        at_last_timestamp = chunk.index == chunk.index[-1]
+        carried = chunk[at_last_timestamp]
+        if not at_last_timestamp.all():
+            partials.append(partial_resample_bid_ask(chunk[~at_last_timestamp]))
+    if carried is not None and not carried.empty:
+        partials.append(partial_resample_bid_ask(carried))
+    logger.debug(f"get_data: retrieved {rows} rows")
+    return combine_resampled_bid_ask(partials)
+
+
+def combine_resampled_bid_ask(partials: List[pd.DataFrame]) -> pd.DataFrame:
+    columns = ['bid_q', 'bid', 'ask_q', 'ask', 'exchange', 'currency_1', 'currency_2']
+    if not partials:
+        return pd.DataFrame(columns=columns, index=pd.DatetimeIndex([], name='timestamp'))
+    # A second split across two chunks shows up in both partials
+    combined = pd.concat(partials).groupby(level=['exchange', 'currency_1', 'currency_2', 'timestamp']).sum()
+    combined['bid'] = combined['bid_sum'] / combined['bid_count']
+    combined['ask'] = combined['ask_sum'] / combined['ask_count']
+    bid_ask_df_resampled = combined.reset_index(level=['exchange', 'currency_1', 'currency_2'])[columns].dropna()
     return bid_ask_df_resampled
 
 
+# Decimation: charts get at most max_points_per_trace points per trace, whatever the horizon. The x axis is split in
+# max_points / 2 equal time buckets (about a pixel each) and the min and max of each bucket are kept, in time order, so
+# spikes stay visible, unlike with plain subsampling or averaging.
+def decimation_indices(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """Positions of the (x, y) points to plot, x sorted. NaN values are dropped."""
+    valid = np.flatnonzero(~np.isnan(y))
+    if len(valid) <= max_points:
+        return valid
+    x, y = x[valid].astype(np.float64), y[valid]
+    n_buckets = max(max_points // 2, 1)
+    buckets = np.minimum(((x - x[0]) / (x[-1] - x[0] or 1) * n_buckets).astype(np.int64), n_buckets - 1)
+    # Sorted by bucket, then by value: the first point of each bucket is its min, the last one its max
+    order = np.lexsort((y, buckets))
+    sorted_buckets = buckets[order]
+    firsts = np.flatnonzero(np.r_[True, sorted_buckets[1:] != sorted_buckets[:-1]])
+    lasts = np.r_[firsts[1:], len(order)] - 1
+    return valid[np.unique(np.concatenate((order[firsts], order[lasts])))]
 
 
+def decimate(series: pd.Series, max_points: int = None) -> pd.Series:
+    max_points = max_points or config.get("web_gui.max_points_per_trace", 2000)
+    index = series.index
+    x = index.asi8 if isinstance(index, pd.DatetimeIndex) else np.arange(len(series))
+    return series.iloc[decimation_indices(x, series.to_numpy(dtype=np.float64, na_value=np.nan), max_points)]
 
-def build_bid_ask_plot(current_bid_ask_df: pd.DataFrame, exchange: str, currency_1: str) -> go.Figure:
+
+def build_bid_ask_plot(current_bid_ask_df: pd.DataFrame, exchange: str, currency_1: str) -> "go.Figure":
+    import plotly.graph_objects as go
     fig = go.Figure()
-    fig.add_trace(go.Scatter(x=current_bid_ask_df.index, y=current_bid_ask_df['bid'], mode='lines', name='Bid', line=dict(color='#A2E3C4')))
-    fig.add_trace(go.Scatter(x=current_bid_ask_df.index, y=current_bid_ask_df['ask'], mode='lines', name='Ask', line=dict(color='#D90368')))
+    bid, ask = decimate(current_bid_ask_df['bid']), decimate(current_bid_ask_df['ask'])
+    fig.add_trace(go.Scatter(x=bid.index, y=bid, mode='lines', name='Bid', line=dict(color='#A2E3C4')))
+    fig.add_trace(go.Scatter(x=ask.index, y=ask, mode='lines', name='Ask', line=dict(color='#D90368')))
     # Set the y-axis range to start closer to the minimum bid/ask price
     min_price = min(current_bid_ask_df[['bid', 'ask']].min())
     max_price = max(current_bid_ask_df[['bid', 'ask']].max())
@@ -123,11 +182,25 @@ def build_bid_ask_plot(current_bid_ask_df: pd.DataFrame, exchange: str, currency
     )
     return fig
 
-def build_spreads_plot(current_bid_ask_df: pd.DataFrame, exchange: str, currency_1: str) -> go.Figure:
+def build_spreads_plot(current_bid_ask_df: pd.DataFrame, exchange: str, currency_1: str, stats_df: pd.DataFrame = None) -> "go.Figure":
+    import plotly.graph_objects as go
     fig = go.Figure()
-    fig.add_trace(go.Scatter(x=current_bid_ask_df.index, 
-                            y=(current_bid_ask_df['ask'] - current_bid_ask_df['bid']) / (current_bid_ask_df['ask'] + current_bid_ask_df['bid']) * 2 * 10000, 
-                            mode='lines', name='Bid', line=dict(color='#FFA62B')))
+    if stats_df is not None and stats_df.size:
+        # Precomputed per minute mean, min and max: no need to go through the ticks
+        for column, name, color in (('spread_bps_max', 'Max', '#FFD29D'), ('spread_bps_mean', 'Mean', '#FFA62B'), ('spread_bps_min', 'Min', '#FFD29D')):
+            fig.add_trace(go.Scatter(x=stats_df.index, y=stats_df[column], mode='lines', name=name, line=dict(color=color)))
+        fig.update_layout(
+        yaxis=dict(
+            range=[stats_df['spread_bps_min'].min() - 1, stats_df['spread_bps_max'].max() + 1],
+            title='Spread (in bips)'
+        ),
+        xaxis=dict(
+            title='Time'
+        ),
+        )
+        return fig
+    spreads = decimate((current_bid_ask_df['ask'] - current_bid_ask_df['bid']) / (current_bid_ask_df['ask'] + current_bid_ask_df['bid']) * 2 * 10000)
+    fig.add_trace(go.Scatter(x=spreads.index, y=spreads, mode='lines', name='Bid', line=dict(color='#FFA62B')))
     # Set the y-axis range to start closer to the minimum bid/ask price
     min_price = min(current_bid_ask_df['ask'] - current_bid_ask_df['bid'])
     max_price = max(current_bid_ask_df['ask'] - current_bid_ask_df['bid'])
@@ -144,11 +217,17 @@ def build_spreads_plot(current_bid_ask_df: pd.DataFrame, exchange: str, currency
     return fig
 
 
-def get_arb_figures(time_horizon_in_hours: float, currency_1:str, taking_fees: Dict) -> List[go.Figure]:
+def get_arb_figures(time_horizon_in_hours: float, currency_1:str, taking_fees: Dict) -> List["go.Figure"]:
     exchanges = get_exchanges()
     start = time.time()
     bid_ask_df = get_data(time_horizon_in_hours)
     logger.debug(f"Loading data which should be cached took: {time.time() - start:.2f} seconds")
+    return build_arb_figures(bid_ask_df, exchanges, currency_1, taking_fees)
+
+
+# Builds one figure per pair of exchanges from (resampled) bid/ask data
+def build_arb_figures(bid_ask_df: pd.DataFrame, exchanges: List[str], currency_1: str, taking_fees: Dict) -> List["go.Figure"]:
+    import plotly.graph_objects as go
     figures = []
 
     df_per_exchange = {}
@@ -173,20 +252,18 @@ def get_arb_figures(time_horizon_in_hours: float, currency_1:str, taking_fees: D
             df_combined.columns = ['_'.join(col).strip() for col in df_combined.columns.values]
 
             # Calculate the arbitrage opportunity
-            df_combined[f"arbitrage_opportunity_{exchange_1}_over_{exchange_2}"] = df_combined.apply(
-                lambda row: max(row[exchange_1 + '_bid'] - row[exchange_2 + '_ask'] - row[exchange_1 + '_bid'] * total_taking_fees / 100, 0) if pd.notnull(row[exchange_2 + '_ask']) else 0,
-                axis=1
-            )
-            df_combined[f"arbitrage_opportunity_{exchange_2}_over_{exchange_1}"] = df_combined.apply(
-                lambda row: max(row[exchange_2 + '_bid'] - row[exchange_1 + '_ask'] - row[exchange_2 + '_bid'] * total_taking_fees / 100, 0) if pd.notnull(row[exchange_1 + '_ask']) else 0,
-                axis=1
-            )
+            # Vectorized: max(bid - ask - fees, 0), NaN without a bid, 0 without an ask (same as a row by row max())
+            for bid_exchange, ask_exchange in ((exchange_1, exchange_2), (exchange_2, exchange_1)):
+                bid, ask = df_combined[bid_exchange + '_bid'], df_combined[ask_exchange + '_ask']
+                df_combined[f"arbitrage_opportunity_{bid_exchange}_over_{ask_exchange}"] = np.where(
+                    ask.notnull(), np.maximum(bid - ask - bid * total_taking_fees / 100, 0), 0
+                )
             fig = go.Figure()
-            fig.add_trace(go.Scatter(x=df_combined.index, 
-                                    y=df_combined[f"arbitrage_opportunity_{exchange_1}_over_{exchange_2}"], 
+            arb_1_over_2 = decimate(df_combined[f"arbitrage_opportunity_{exchange_1}_over_{exchange_2}"])
+            arb_2_over_1 = decimate(df_combined[f"arbitrage_opportunity_{exchange_2}_over_{exchange_1}"])
+            fig.add_trace(go.Scatter(x=arb_1_over_2.index, y=arb_1_over_2,
                                     mode='lines', name=f'{exchange_1} over {exchange_2}', line=dict(color='#07553B')))
-            fig.add_trace(go.Scatter(x=df_combined.index, 
-                                    y=df_combined[f"arbitrage_opportunity_{exchange_2}_over_{exchange_1}"], 
+            fig.add_trace(go.Scatter(x=arb_2_over_1.index, y=arb_2_over_1,
                                     mode='lines', name=f'{exchange_2} over {exchange_1}', line=dict(color='#CED46A')))
             # Set the y-axis range to start closer to the minimum bid/ask price
             min_arb = 0
@@ -204,6 +281,3 @@ def get_arb_figures(time_horizon_in_hours: float, currency_1:str, taking_fees: D
             figures.append(fig)
             logger.debug(f"Building {exchange_1} over {exchange_2} arbitrage opportunities took {time.time() - start:.2f} seconds")
     return figures
-
-data2 = get_data(2)
-print("done")
\ No newline at end of file